@@ -0,0 +1,435 @@
+import argparse
+import http.server
+import json
+import os
+import platform
+import random
+import sqlite3
+import string
+import subprocess
+import tempfile
+import threading
+import time
+
+import requests
+from bs4 import BeautifulSoup as bs
+
+import exporter
+import main
+import parsing
+from database import database
+from httpcache import http_cache
+from main import SearchTerm, TermMatcher, Article, categorize_articles, categorize_articles_in_pool, parse_articles, REQUEST_TIMEOUT
+from scrapers import SCRAPERS
+from textstore import decompress_text
+from tokenizer import separate_words, iter_words
+
+
+# This function makes up a word so that the benchmarks don't need a real database
+def random_word(rng, length=7):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+# This function makes a list of search terms where a fifth of them are two words long
+def make_search_terms(rng, amount, categories=10):
+    search_terms = []
+    for index in range(amount):
+        term = random_word(rng)
+        if index % 5 == 0:
+            term += " " + random_word(rng)
+        search_terms.append(SearchTerm(term, index % categories + 1))
+    return search_terms
+
+
+# This function makes fake articles that contain some of the search terms so that the matcher has something to find
+def make_articles(rng, search_terms, amount=200, length=800):
+    vocabulary = [random_word(rng) for _ in range(5000)]
+    articles = []
+    for _ in range(amount):
+        words = []
+        for _ in range(length):
+            if rng.random() < 0.02:
+                words.append(rng.choice(search_terms).term)
+            else:
+                words.append(rng.choice(vocabulary))
+        articles.append(" ".join(words).capitalize() + ".")
+    return articles
+
+
+# This function makes news-like paragraphs with the punctuation that the tokenizer has to remove
+def make_paragraphs(rng, amount=2000):
+    vocabulary = [random_word(rng, rng.randint(2, 10)) for _ in range(5000)]
+    decorations = [("", ","), ("", "."), ("“", "”"), ('"', '"'), ("‘", "’s"), ("", "'s"), ("", ":"), ("", "-based"), ("", "/" + random_word(rng, 3))]
+    paragraphs = []
+    for _ in range(amount):
+        words = []
+        for _ in range(rng.randint(20, 120)):
+            word = rng.choice(vocabulary)
+            if rng.random() < 0.15:
+                before, after = rng.choice(decorations)
+                word = before + word + after
+            if rng.random() < 0.1:
+                word = word.capitalize()
+            words.append(word)
+        paragraphs.append(" ".join(words))
+    return paragraphs
+
+
+# This is how separate_words used to work, it is kept here to check that the tokenizer still gives the same words
+def legacy_separate_words(words):
+    separated = words.replace(",", "").replace(".", "").replace('“', "").replace("’", " ").replace("‘", "").replace("-", " ").replace("”", "").replace('"', "").replace("'", " ").replace(":", "").replace("/", " ").lower().split()
+    return separated
+
+
+# This function checks that every tokenizer gives the same words as the old separate_words and then measures how fast each of them is
+def benchmark_tokenizer(paragraph_amount=2000, repeat=5, seed=1):
+    rng = random.Random(seed)
+    paragraphs = make_paragraphs(rng, paragraph_amount)
+    paragraphs.append(" ".join(paragraphs))
+    tokenizers = {"legacy": legacy_separate_words, "separate_words": separate_words, "iter_words": lambda text: list(iter_words(text))}
+    for text in paragraphs:
+        expected = legacy_separate_words(text)
+        for name, tokenize in tokenizers.items():
+            if tokenize(text) != expected:
+                raise AssertionError(f"The {name} tokenizer gives different words for {text[:80]!r}")
+    characters = sum(len(text) for text in paragraphs)
+    results = []
+    for name, tokenize in tokenizers.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text in paragraphs:
+                tokenize(text)
+        elapsed = time.perf_counter() - start
+        results.append({"tokenizer": name, "megabytes_per_second": characters * repeat / elapsed / 1e6})
+    return results
+
+
+# This is the loop that scrape_articles used before the matcher, it is kept here so the two can be compared
+def legacy_count_categories(words, search_terms):
+    category_counter = {}
+    previous_word = ""
+    for word in words:
+        for search_term in search_terms:
+            if word == search_term.term or previous_word + " " + word == search_term.term:
+                try:
+                    category_counter[search_term.category] += 1
+                except KeyError:
+                    category_counter[search_term.category] = 1
+        previous_word = word
+    return category_counter
+
+
+# This function measures how many words per second the old loop and the matcher can get through with 10, 1k and 50k search terms
+def benchmark_matcher(term_amounts=(10, 1000, 50000), legacy_limit=1000, seed=1):
+    rng = random.Random(seed)
+    results = []
+    for amount in term_amounts:
+        search_terms = make_search_terms(rng, amount)
+        tokenized = [separate_words(article) for article in make_articles(rng, search_terms)]
+        word_total = sum(len(words) for words in tokenized)
+
+        start = time.perf_counter()
+        matcher = TermMatcher(search_terms)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for words in tokenized:
+            matcher.count_categories(matcher.count_terms(words))
+        matcher_time = time.perf_counter() - start
+
+        result = {"terms": amount, "words": word_total, "build_seconds": build_time,
+                  "matcher_words_per_second": word_total / matcher_time}
+        # The old loop gets too slow to wait for with a lot of search terms, so it is only timed on a few articles
+        if amount <= legacy_limit:
+            sample = tokenized[:20]
+            start = time.perf_counter()
+            for words in sample:
+                legacy_count_categories(words, search_terms)
+            legacy_time = time.perf_counter() - start
+            result["legacy_words_per_second"] = sum(len(words) for words in sample) / legacy_time
+        results.append(result)
+    return results
+
+
+# This function wraps fake articles in html so the parse stage has real work to do
+def make_article_pages(rng, search_terms, amount):
+    pages = []
+    for article in make_articles(rng, search_terms, amount):
+        words = article.split()
+        paragraphs = "".join(f"<p>{' '.join(words[start:start + 60])}</p>" for start in range(0, len(words), 60))
+        pages.append(f"<html><head><title>Article</title></head><body><div class='article'>{paragraphs}</div><footer><a href='/'>Home</a></footer></body></html>".encode())
+    return pages
+
+
+# This function measures how many articles per second the parse and categorize stages get through in the main process and with 1 to N worker processes
+def benchmark_process_pool(max_workers=None, page_amount=2000, term_amount=5000, seed=1):
+    rng = random.Random(seed)
+    search_terms = make_search_terms(rng, term_amount)
+    for term_id, search_term in enumerate(search_terms, 1):
+        search_term.term_id = term_id
+    matcher = TermMatcher(search_terms)
+    pages = make_article_pages(rng, search_terms, page_amount)
+    max_workers = max_workers or os.cpu_count()
+    worker_amounts = [0] + [workers for workers in (1, 2, 4, 8, 16, 32, 64) if workers < max_workers] + [max_workers]
+    results = []
+    for workers in worker_amounts:
+        fetched = [(Article(f"https://example.com/{index}", 1), page, None) for index, page in enumerate(pages)]
+        start = time.perf_counter()
+        if workers:
+            stage = categorize_articles_in_pool(fetched, matcher, workers)
+        else:
+            stage = categorize_articles(parse_articles(fetched), matcher)
+        for _ in stage:
+            pass
+        elapsed = time.perf_counter() - start
+        results.append({"workers": workers, "articles_per_second": page_amount / elapsed})
+    return results
+
+
+FIXTURE_DIR = "fixtures"
+
+# These are the front pages that have fixtures and the part of each page that the scraper reads
+FRONT_PAGES = {
+    "reuters": ("https://reuters.com", SCRAPERS["https://reuters.com"].parse_only),
+    "ap": ("https://apnews.com", SCRAPERS["https://apnews.com"].parse_only),
+}
+
+
+# This function saves the front pages of reuters and apnews and some of their articles from news.db, so the parsers can be compared on real pages
+def save_fixtures(fixture_dir=FIXTURE_DIR, database_path="news.db", articles_per_site=10):
+    os.makedirs(fixture_dir, exist_ok=True)
+    connection = sqlite3.connect(database_path)
+    for name, (domain_url, strainer) in FRONT_PAGES.items():
+        with open(os.path.join(fixture_dir, f"front-{name}.html"), "wb") as file:
+            file.write(requests.get(domain_url, timeout=REQUEST_TIMEOUT).content)
+        rows = connection.execute("select url from scraped_articles join domains on domains.id = scraped_articles.domain_id "
+                                  "where domains.domain = ? order by scraped_articles.id desc limit ?", (domain_url, articles_per_site)).fetchall()
+        for index, row in enumerate(rows):
+            with open(os.path.join(fixture_dir, f"article-{name}-{index}.html"), "wb") as file:
+                file.write(requests.get(row[0], timeout=REQUEST_TIMEOUT).content)
+    connection.close()
+
+
+# This function times every installed parser on the saved pages, the front pages are parsed in full and with the scraper's SoupStrainer
+def benchmark_parsers(fixture_dir=FIXTURE_DIR, repeat=5):
+    pages = {}
+    for file_name in sorted(os.listdir(fixture_dir)):
+        with open(os.path.join(fixture_dir, file_name), "rb") as file:
+            pages[file_name] = file.read()
+    results = []
+
+    def timed(label, kind, function, documents):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for document in documents:
+                function(document)
+        elapsed = time.perf_counter() - start
+        results.append({"pages": kind, "parser": label, "milliseconds_per_page": elapsed / (repeat * len(documents)) * 1000})
+
+    articles = [html for file_name, html in pages.items() if file_name.startswith("article-")]
+    if articles:
+        timed("html.parser without strainer", "articles", lambda html: [par.text for par in bs(html, "html.parser").find_all("p")], articles)
+        for backend in parsing.BACKENDS:
+            timed(backend, "articles", lambda html: parsing.article_paragraphs(html, backend), articles)
+
+    for name, (domain_url, strainer) in FRONT_PAGES.items():
+        front_page = pages.get(f"front-{name}.html")
+        if front_page is None:
+            continue
+        for features in ("html.parser", "lxml") if parsing.lxml is not None else ("html.parser",):
+            timed(f"{features} without strainer", f"{name} front page", lambda html: bs(html, features), [front_page])
+            timed(f"{features} with strainer", f"{name} front page", lambda html: bs(html, features, parse_only=strainer), [front_page])
+    return results
+
+
+# This function fills a new database with made up domains, categories, search terms and articles spread over a number of days
+# The term index is left empty so that building it can be timed as its own stage
+def generate_database(path, article_amount=10000, term_amount=1000, category_amount=10, domain_amount=5, days=365, seed=1, batch_size=10000):
+    rng = random.Random(seed)
+    if os.path.exists(path):
+        os.remove(path)
+    database.open(path)
+    main.setup_database()
+    search_terms = make_search_terms(rng, term_amount, category_amount)
+    vocabulary = [random_word(rng, rng.randint(2, 10)) for _ in range(20000)]
+    with database.unit_of_work() as cursor:
+        cursor.executemany("insert into domains (domain) values (?)", [(f"https://news{index}.example.com",) for index in range(domain_amount)])
+        cursor.executemany("insert into categories (category) values (?)", [(f"category {index}",) for index in range(1, category_amount + 1)])
+        cursor.executemany("insert into search_terms (category_id, term) values (?, ?)", [(term.category, term.term) for term in search_terms])
+        # The terms are already counted in every article once the index is built from scratch, so they don't have to be backfilled
+        # Their backfill rows are made here as done, otherwise the next setup_database would make them as not done and every count would read the texts
+        cursor.execute("insert into term_backfill (term_id, done) select id, 1 from search_terms")
+    start_ordinal = main.date.today().toordinal() - days
+    for batch_start in range(0, article_amount, batch_size):
+        rows = []
+        for index in range(batch_start, min(batch_start + batch_size, article_amount)):
+            words = [rng.choice(search_terms).term if rng.random() < 0.01 else rng.choice(vocabulary) for _ in range(rng.randint(150, 600))]
+            day = main.date.fromordinal(start_ordinal + index * days // article_amount).isoformat()
+            rows.append((index + 1, index % domain_amount + 1, f"https://news{index % domain_amount}.example.com/story/synthetic-news-article-{index}", " ".join(words), day))
+        with database.unit_of_work() as cursor:
+            cursor.executemany("insert into scraped_articles (id, domain_id, url, date) values (?, ?, ?, ?)", [(row[0], row[1], row[2], row[4]) for row in rows])
+            main.save_article_texts(cursor, [(row[0], row[3]) for row in rows])
+            cursor.executemany("insert into known_urls (url) values (?)", [(row[2],) for row in rows])
+    return search_terms
+
+
+# This function counts every search term in every stored article with the same code that the scraper uses, this is the cost of building the index from scratch
+def build_term_index(batch_size=1000):
+    search_terms = main.load_search_terms()
+    matcher = TermMatcher(search_terms)
+    after_article_id = 0
+    while True:
+        with database.unit_of_work() as cursor:
+            rows = cursor.execute("select article_id, text from article_texts where article_id > ? order by article_id limit ?", (after_article_id, batch_size)).fetchall()
+            if not rows:
+                break
+            for article_id, text in rows:
+                term_counts = matcher.count_terms(separate_words(decompress_text(text)))
+                main.insert_term_hits(cursor, article_id, term_counts)
+                category = matcher.best_category(matcher.count_categories(term_counts))
+                if category is not None:
+                    cursor.execute("update scraped_articles set category_id = ? where id = ?", (category, article_id))
+        after_article_id = rows[-1][0]
+
+
+# The synthetic news site has a front page that links to a number of articles and makes up every article page from its number
+class SyntheticNewsHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    article_amount = 100
+    search_terms = []
+
+    def do_GET(self):
+        if self.path == "/":
+            links = "".join(f'<li><a href="/story/synthetic-news-article-{index}">Story {index}</a></li>' for index in range(self.article_amount))
+            body = f"<html><body><ul>{links}</ul></body></html>"
+        else:
+            rng = random.Random(self.path)
+            paragraphs = []
+            for _ in range(8):
+                words = [rng.choice(self.search_terms).term if self.search_terms and rng.random() < 0.02 else random_word(rng, rng.randint(2, 10)) for _ in range(60)]
+                paragraphs.append("<p>" + " ".join(words).capitalize() + ".</p>")
+            body = f"<html><head><title>{self.path}</title></head><body><nav><a href='/'>Home</a></nav><article>{''.join(paragraphs)}</article></body></html>"
+        content = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+# This function starts the synthetic news site in a background thread and returns the server and its url
+def start_news_server(article_amount, search_terms):
+    handler = type("Handler", (SyntheticNewsHandler,), {"article_amount": article_amount, "search_terms": search_terms})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# This function times a stage and adds the result to the list, stages that don't change the database can be repeated and the fastest time is kept
+def time_stage(results, stage, function, *args, repeat=1, **kwargs):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+    results.append({"stage": stage, "seconds": min(timings)})
+    return value
+
+
+# This function builds a synthetic database and times every hot path of the program on it from start to end
+def benchmark_pipeline(article_amount=10000, term_amount=1000, scrape_amount=500, new_url_amount=1000, workers=0, directory=None, seed=1):
+    directory = directory or tempfile.mkdtemp(prefix="news-benchmark-")
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    search_terms = time_stage(results, "generate database", generate_database, os.path.join(directory, "news.db"), article_amount, term_amount, seed=seed)
+    time_stage(results, "build term index", build_term_index)
+
+    # Half of the new urls are already in the database, so add_urls has to find them among all of the stored ones
+    rng = random.Random(seed)
+    urls = {f"https://news0.example.com/story/synthetic-news-article-{rng.randrange(article_amount)}" for _ in range(new_url_amount // 2)}
+    urls |= {f"https://news0.example.com/story/new-article-{index}" for index in range(new_url_amount // 2)}
+    time_stage(results, "add_urls", main.add_urls, urls, "https://news0.example.com")
+    with database.unit_of_work() as cursor:
+        cursor.execute("delete from unscraped_articles")
+
+    term = search_terms[0].term
+    time_stage(results, "count_word_occurrence by day", main.count_word_occurrence, term, repeat=3)
+    time_stage(results, "count_word_occurrence by month", main.count_word_occurrence, term, "month", repeat=3)
+    time_stage(results, "count_category_occurrence", main.count_category_occurrence, 1, repeat=3)
+    time_stage(results, "count_total_category_occurrence", main.count_total_category_occurrence, repeat=3)
+    trend_terms = [search_term.term for search_term in search_terms[:10]]
+    time_stage(results, "count_word_occurrence for 10 terms", lambda: [main.count_word_occurrence(term) for term in trend_terms], repeat=3)
+    time_stage(results, "load_term_trends for 10 terms", main.load_term_trends, trend_terms, repeat=3)
+    phrase = " ".join(trend_terms[:2])
+    time_stage(results, "search_articles for a phrase", main.search_articles, phrase, repeat=3)
+    time_stage(results, "load_phrase_trends for a phrase", main.load_phrase_trends, [phrase], repeat=3)
+    texts = [decompress_text(row[0]) for row in database.connection().execute("select text from article_texts limit 1000")]
+    time_stage(results, "separate_words over 1000 articles", lambda: [separate_words(text) for text in texts], repeat=3)
+    time_stage(results, "export archive with texts", exporter.export_archive, os.path.join(directory, "export"), "jsonl.gz", exporter.ExportFilter(with_text=True))
+
+    # The scrape runs against the synthetic news site on this computer, so the time is the cost of the program rather than of the network
+    server, domain_url = start_news_server(scrape_amount, search_terms)
+    http_cache.directory = os.path.join(directory, "http_cache")
+    with database.unit_of_work() as cursor:
+        cursor.execute("insert into domains (domain) values (?)", (domain_url,))
+    # Only the synthetic site is scraped, the made up domains of the database don't exist
+    time_stage(results, "scrape front page", lambda: main.add_urls(main.scrape_front_page(domain_url, main.front_page_fetcher), domain_url))
+    totals = time_stage(results, "scrape articles", main.scrape_articles, workers=workers)
+    server.shutdown()
+    results[-1]["articles"] = totals["scraped"]
+    results[-1]["articles_per_second"] = totals["scraped"] / results[-1]["seconds"]
+    database.close()
+    return results
+
+
+# This function describes the computer and the versions that the results came from, so results from different versions can be compared
+def environment():
+    try:
+        head = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        head = None
+    return {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "git_head": head, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Time the hot paths of the Online Media Sentiment Tracker")
+    parser.add_argument("--articles", type=int, default=10000, help="Articles in the synthetic database")
+    parser.add_argument("--terms", type=int, default=1000, help="Search terms in the synthetic database")
+    parser.add_argument("--scrape-articles", type=int, default=500, help="Articles on the synthetic news site")
+    parser.add_argument("--workers", type=int, default=0, help="Processes used to parse the scraped articles")
+    parser.add_argument("--directory", help="Where the synthetic database is made, a temporary directory is used if it is left out")
+    parser.add_argument("--output", default="benchmark-results.json", help="The json file that the results are written to")
+    parser.add_argument("--micro", action="store_true", help="Also run the tokenizer, matcher, parser and process pool benchmarks")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    report = {"environment": environment(), "settings": vars(arguments)}
+    report["pipeline"] = benchmark_pipeline(arguments.articles, arguments.terms, arguments.scrape_articles, workers=arguments.workers, directory=arguments.directory)
+    for result in report["pipeline"]:
+        print(f"{result['stage']:>35}: {result['seconds']:9.3f}s")
+    if arguments.micro:
+        report["process_pool"] = benchmark_process_pool()
+        for result in report["process_pool"]:
+            print(f"{result['workers']:>3} parse workers: {result['articles_per_second']:>8.0f} articles/s")
+        # The parser benchmark needs saved pages, run save_fixtures() once to download them
+        if os.path.isdir(FIXTURE_DIR):
+            report["parsers"] = benchmark_parsers()
+            for result in report["parsers"]:
+                print(f"{result['pages']:>20}: {result['parser']:<30} {result['milliseconds_per_page']:8.2f} ms/page")
+        report["tokenizer"] = benchmark_tokenizer()
+        for result in report["tokenizer"]:
+            print(f"{result['tokenizer']:>14}: {result['megabytes_per_second']:.1f} MB/s")
+        report["matcher"] = benchmark_matcher()
+        for result in report["matcher"]:
+            line = f"{result['terms']:>6} terms: matcher {result['matcher_words_per_second']:>12,.0f} words/s (built in {result['build_seconds']:.3f}s)"
+            if "legacy_words_per_second" in result:
+                line += f", old loop {result['legacy_words_per_second']:>12,.0f} words/s"
+            print(line)
+    with open(arguments.output, "w") as file:
+        json.dump(report, file, indent=2)
@@ -0,0 +1,133 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+DATABASE_PATH = "news.db"
+
+# These pragmas are set once on every connection, WAL lets the scraper write while the menu and the backfill read
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    # With WAL a commit only has to wait for the log to be written, the database file is synced at checkpoints
+    "PRAGMA synchronous = NORMAL",
+    # A negative cache size is in kibibytes, so this is 64 MB of page cache per connection
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = True",
+)
+
+# sqlite3 keeps this many prepared statements per connection and reuses them when the same sql text is executed again
+CACHED_STATEMENTS = 256
+
+
+# The database keeps one open connection per thread, so the connection setup is only paid once and threads never share a connection
+# A thread that is done with the database should call release, the connections of threads that have ended are closed the next time a connection is opened
+class Database:
+
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+        self.local = threading.local()
+        # This dictionary stores the threads in the keys and their connection in the values
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        with self.lock:
+            for thread in [thread for thread in self.connections if not thread.is_alive()]:
+                self.connections.pop(thread).close()
+            self.connections[threading.current_thread()] = connection
+        return connection
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+            self.local.depth = 0
+        return connection
+
+    # Everything done inside this context is committed together when the outermost one ends, or rolled back if there is an error
+    @contextmanager
+    def unit_of_work(self):
+        connection = self.connection()
+        cursor = connection.cursor()
+        self.local.depth += 1
+        try:
+            yield cursor
+        except BaseException:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                connection.rollback()
+            raise
+        else:
+            self.local.depth -= 1
+            if self.local.depth == 0:
+                connection.commit()
+        finally:
+            cursor.close()
+
+    # This function closes the connection of the thread that calls it, the next unit of work in the thread opens a new one
+    def release(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            return
+        with self.lock:
+            if self.connections.get(threading.current_thread()) is connection:
+                del self.connections[threading.current_thread()]
+        connection.close()
+        self.local.connection = None
+
+    # This function closes the connection of this thread and the ones of threads that have ended, the threads that are still running keep theirs
+    def close(self):
+        self.release()
+        with self.lock:
+            for thread in [thread for thread in self.connections if not thread.is_alive()]:
+                self.connections.pop(thread).close()
+
+    # This function points the database at another file, every connection is closed because they are all to the old file
+    def open(self, path):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
+        self.local = threading.local()
+        self.path = path
+
+    # This function runs a script of sql statements one at a time on the cursor, unlike executescript it doesn't commit first so the statements stay in the unit of work
+    @staticmethod
+    def execute_script(cursor, script):
+        statement = ""
+        for part in script.split(";"):
+            statement += part + ";"
+            if sqlite3.complete_statement(statement):
+                if statement.strip(" \n;"):
+                    cursor.execute(statement)
+                statement = ""
+
+
+database = Database()
+
+
+# This decorator function gives the function a cursor from the shared connection of the current thread and commits when the function is done
+def connector(function):
+    def wrapper(*args, **kwargs):
+        with database.unit_of_work() as cursor:
+            return function(cursor, *args, **kwargs)
+
+    wrapper.__name__ = function.__name__
+    return wrapper
+
+
+# This decorator function releases the connection of the current thread when the function is done
+# It is used for the functions that run in the threads of a pool, those threads end when the pool is shut down and would otherwise leave their connection open
+def releasing_connection(function):
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            database.release()
+
+    wrapper.__name__ = function.__name__
+    return wrapper
@@ -0,0 +1,174 @@
+import csv
+import gzip
+import json
+import os
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from database import connector, releasing_connection
+from textstore import FETCH_SIZE, decompress_text, iter_rows
+
+# pyarrow is only needed for parquet files, the other formats work without it
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+EXPORT_FORMATS = ["csv", "jsonl", "csv.gz", "jsonl.gz", "parquet"]
+
+# Every file of an export has at most this many articles
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_WORKERS = min(4, os.cpu_count() or 1)
+
+COLUMNS = ["id", "url", "domain", "category", "date"]
+
+
+# This class describes which articles are exported, the days are in the yyyy-mm-dd format and the domains are written the same way as in the domains table
+class ExportFilter:
+
+    def __init__(self, start=None, end=None, domains=None, with_text=False):
+        self.start = start
+        self.end = end
+        self.domains = list(domains or [])
+        self.with_text = with_text
+
+    def columns(self):
+        return COLUMNS + ["text"] if self.with_text else COLUMNS
+
+    # This function returns the where clause of the filter and its parameters, the articles after after_id and up to last_id are the ones in one chunk
+    def where(self, after_id=0, last_id=None):
+        conditions = ["scraped_articles.id > ?"]
+        parameters = [after_id]
+        if last_id is not None:
+            conditions.append("scraped_articles.id <= ?")
+            parameters.append(last_id)
+        if self.start:
+            conditions.append("scraped_articles.date >= ?")
+            parameters.append(self.start)
+        if self.end:
+            conditions.append("scraped_articles.date <= ?")
+            parameters.append(self.end)
+        if self.domains:
+            conditions.append(f"domains.domain in ({','.join('?' * len(self.domains))})")
+            parameters += self.domains
+        return " and ".join(conditions), parameters
+
+    # This function returns the query that reads the articles, the text is only joined in when it is exported
+    def query(self, after_id=0, last_id=None):
+        where, parameters = self.where(after_id, last_id)
+        text = ", article_texts.text" if self.with_text else ""
+        join = "left join article_texts on article_texts.article_id = scraped_articles.id " if self.with_text else ""
+        return (f"select scraped_articles.id, scraped_articles.url, domains.domain, categories.category, scraped_articles.date{text} "
+                "from scraped_articles left join domains on domains.id = scraped_articles.domain_id "
+                f"left join categories on categories.id = scraped_articles.category_id {join}"
+                f"where {where} order by scraped_articles.id"), parameters
+
+
+# This function turns a row from the query into the values that are written, the text is decompressed
+def export_row(row, with_text):
+    return row[:5] + (decompress_text(row[5]),) if with_text else row
+
+
+# This function writes the articles as csv or json lines, one row at a time so the archive never has to fit in memory
+@connector
+def export_articles(cursor, file, output_format="csv", export_filter=None):
+    export_filter = export_filter or ExportFilter()
+    columns = export_filter.columns()
+    rows = (export_row(row, export_filter.with_text) for row in iter_rows(cursor.execute(*export_filter.query())))
+    write_rows(file, rows, columns, output_format)
+
+
+def write_rows(file, rows, columns, output_format):
+    if output_format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            file.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+
+# This function returns the id of the last article of the chunk that starts after after_id, or None when there are no articles left
+@connector
+def chunk_end(cursor, export_filter, after_id, chunk_size):
+    where, parameters = export_filter.where(after_id)
+    tables = "scraped_articles left join domains on domains.id = scraped_articles.domain_id"
+    cursor.execute(f"select scraped_articles.id from {tables} where {where} order by scraped_articles.id limit 1 offset ?", parameters + [chunk_size - 1])
+    row = cursor.fetchone()
+    if row is None:
+        cursor.execute(f"select max(scraped_articles.id) from {tables} where {where}", parameters)
+        row = cursor.fetchone()
+    return row[0]
+
+
+# The columns of a parquet file, they are given up front because a batch where every value of a column is null doesn't show its type
+PARQUET_TYPES = {"id": "int64", "url": "string", "domain": "string", "category": "string", "date": "string", "text": "string"}
+
+
+# This function writes one chunk to its own file and returns the path and the amount of articles in it, it runs in a worker thread with its own connection
+# The rows are streamed from the query into the file a few at a time, so a worker never holds the whole chunk in memory
+@connector
+def export_chunk(cursor, path, output_format, export_filter, after_id, last_id):
+    columns = export_filter.columns()
+    counted = [0]
+
+    def rows():
+        for row in iter_rows(cursor.execute(*export_filter.query(after_id, last_id))):
+            counted[0] += 1
+            yield export_row(row, export_filter.with_text)
+
+    if output_format == "parquet":
+        write_parquet(path, rows(), columns)
+    elif output_format.endswith(".gz"):
+        with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6) as file:
+            write_rows(file, rows(), columns, output_format[:-3])
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            write_rows(file, rows(), columns, output_format)
+    return path, counted[0]
+
+
+# This function writes the rows to a parquet file with one row group per batch of rows
+def write_parquet(path, rows, columns, batch_size=FETCH_SIZE * 10):
+    schema = pyarrow.schema([(column, PARQUET_TYPES[column]) for column in columns])
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            writer.write_table(pyarrow.table({column: [row[index] for row in batch] for index, column in enumerate(columns)}, schema=schema))
+
+
+# This function exports the articles to a directory with one file per chunk, the chunks are read, compressed and written by several threads at the same time
+# Only as many chunks as there are workers are worked on at once, so the memory that is used doesn't grow with the archive
+def export_archive(directory, output_format, export_filter=None, chunk_size=EXPORT_CHUNK_SIZE, workers=EXPORT_WORKERS):
+    if output_format == "parquet" and pyarrow is None:
+        raise RuntimeError("Exporting to parquet needs pyarrow, install it with pip install pyarrow")
+    export_filter = export_filter or ExportFilter()
+    os.makedirs(directory, exist_ok=True)
+    totals = {"files": [], "articles": 0}
+    pending = set()
+    after_id = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            last_id = chunk_end(export_filter, after_id, chunk_size)
+            if last_id is None:
+                break
+            path = os.path.join(directory, f"articles-{len(totals['files']) + len(pending):05d}.{output_format}")
+            pending.add(pool.submit(releasing_connection(export_chunk), path, output_format, export_filter, after_id, last_id))
+            after_id = last_id
+            if len(pending) >= workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done, totals)
+        collect(pending, totals)
+    totals["files"].sort()
+    return totals
+
+
+def collect(futures, totals):
+    for future in futures:
+        path, articles = future.result()
+        totals["files"].append(path)
+        totals["articles"] += articles
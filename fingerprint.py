@@ -0,0 +1,57 @@
+import hashlib
+
+import numpy as np
+
+from tokenizer import separate_words
+
+
+# The fingerprint of an article is a minhash signature of its runs of three words, the share of equal values in two signatures is about the share of runs the articles have in common
+SHINGLE_SIZE = 3
+PERMUTATIONS = 64
+
+# Two articles are the same story when at least this share of their signatures is equal
+MIN_SIMILARITY = 0.8
+
+# The signature is cut into bands of a few values and every band is looked up on its own in the database, only the articles that share a whole band are compared
+# With 16 bands of 4 values an article that shares 80% of its runs is found almost every time, and one that shares 30% only about one time in eight
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+
+# Articles shorter than this many words aren't checked, a short text like a paywall notice looks the same on every article of a site
+MIN_WORDS = 50
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+# The permutations are made from a hash of their number, so they are the same in every process and every version of numpy and the stored signatures stay comparable
+def permutation_parameters():
+    parameters = [int.from_bytes(hashlib.blake2b(f"minhash {index}".encode(), digest_size=8).digest(), "big") for index in range(PERMUTATIONS * 2)]
+    # a stays below 2^31 and the shingle hashes below 2^32, so a * x + b never overflows 64 bits
+    return (np.array([value % (1 << 31) + 1 for value in parameters[:PERMUTATIONS]], dtype=np.uint64)[:, None],
+            np.array([value % (1 << 31) for value in parameters[PERMUTATIONS:]], dtype=np.uint64)[:, None])
+
+
+MULTIPLIERS, INCREMENTS = permutation_parameters()
+
+
+# This function returns the signature of a text as the bytes that are stored in the database, or None if the text is too short
+def signature(text):
+    words = separate_words(text)
+    if len(words) < MIN_WORDS:
+        return None
+    shingles = {" ".join(words[index:index + SHINGLE_SIZE]) for index in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = np.frombuffer(b"".join(hashlib.blake2b(shingle.encode(), digest_size=4).digest() for shingle in shingles), dtype=np.uint32).astype(np.uint64)
+    # Every row is one permutation of the shingle hashes and its smallest value is kept
+    permuted = (MULTIPLIERS * hashes + INCREMENTS) % MERSENNE_PRIME
+    return (permuted.min(axis=1) & 0xFFFFFFFF).astype("<u4").tobytes()
+
+
+# This function returns the value of every band of a signature, each one is a hash of the values in the band so it fits in a sqlite integer
+def bands(signature):
+    return [(band, int.from_bytes(hashlib.blake2b(signature[band * ROWS * 4:(band + 1) * ROWS * 4], digest_size=8).digest(), "big", signed=True))
+            for band in range(BANDS)]
+
+
+# This function returns the share of the values that are the same in two signatures
+def similarity(signature, other):
+    return float(np.mean(np.frombuffer(signature, dtype="<u4") == np.frombuffer(other, dtype="<u4")))
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import threading
+import time
+
+from database import connector
+
+
+CACHE_DIRECTORY = "http_cache"
+# When the saved pages take up more than this many bytes the ones that were used longest ago are deleted
+MAX_CACHE_SIZE = 200 * 1024 * 1024
+
+
+# The cache saves every page it downloads together with its ETag and Last-Modified headers, so the next download of the page can ask the server if it has changed
+class HttpCache:
+
+    def __init__(self, directory=CACHE_DIRECTORY, max_size=MAX_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # The pages whose entry is only saved once the caller confirms that it is done with them
+        self.pending = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "not_modified": 0, "unchanged": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+
+    def count(self, **amounts):
+        with self.lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    # This function downloads a page and returns its content, whether it is the same as the last time it was downloaded and how many bytes of it were downloaded
+    # The content of a page that the server says hasn't changed is read from the cache, so none of its bytes are downloaded
+    # When confirm_later is True a changed page is only saved when confirm is called, so a page that couldn't be handled isn't seen as unchanged the next time
+    def get(self, session, url, timeout, confirm_later=False):
+        entry = load_entry(url)
+        headers = {}
+        if entry is not None and os.path.exists(self.path(url)):
+            etag, last_modified, content_hash, size = entry
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        else:
+            entry = None
+
+        response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            with open(self.path(url), "rb") as file:
+                content = file.read()
+            touch_entry(url)
+            self.count(requests=1, not_modified=1, bytes_saved=len(content))
+            return content, True, 0
+        response.raise_for_status()
+
+        content = response.content
+        content_hash = hashlib.sha256(content).hexdigest()
+        # Some servers don't support conditional requests, but if the page is exactly the same it doesn't have to be parsed again
+        unchanged = entry is not None and entry[2] == content_hash
+        self.count(requests=1, unchanged=int(unchanged), bytes_downloaded=len(content))
+        page = (content, unchanged, response.headers.get("ETag"), response.headers.get("Last-Modified"), content_hash)
+        if confirm_later and not unchanged:
+            with self.lock:
+                self.pending[url] = page
+        else:
+            self.save(url, *page)
+        return content, unchanged, len(content)
+
+    def save(self, url, content, unchanged, etag, last_modified, content_hash):
+        if not unchanged:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path(url), "wb") as file:
+                file.write(content)
+        save_entry(url, etag, last_modified, content_hash, len(content))
+        self.evict()
+
+    # This function saves a page that was downloaded with confirm_later
+    def confirm(self, url):
+        with self.lock:
+            page = self.pending.pop(url, None)
+        if page is not None:
+            self.save(url, *page)
+
+    # This function forgets a page that was downloaded with confirm_later, the next download of it is handled as a new page
+    def discard(self, url):
+        with self.lock:
+            self.pending.pop(url, None)
+
+    # This function deletes the pages that were used longest ago until the cache fits in its maximum size
+    def evict(self):
+        with self.lock:
+            for url in entries_to_evict(self.max_size):
+                try:
+                    os.remove(self.path(url))
+                except FileNotFoundError:
+                    pass
+
+    # This function describes how well the cache did since the stats were last reset
+    def report(self):
+        hits = self.stats["not_modified"] + self.stats["unchanged"]
+        hit_rate = hits / self.stats["requests"] * 100 if self.stats["requests"] else 0
+        return (f"{hits} of {self.stats['requests']} pages were unchanged ({hit_rate:.0f}%), "
+                f"{self.stats['bytes_downloaded'] / 1e6:.1f} MB downloaded and {self.stats['bytes_saved'] / 1e6:.1f} MB saved")
+
+
+# This function fetches what the cache knows about a url
+@connector
+def load_entry(cursor, url):
+    cursor.execute("select etag, last_modified, content_hash, size from http_cache where url = ?", (url,))
+    return cursor.fetchone()
+
+
+@connector
+def save_entry(cursor, url, etag, last_modified, content_hash, size):
+    cursor.execute("insert or replace into http_cache (url, etag, last_modified, content_hash, size, last_used) values (?, ?, ?, ?, ?, ?)",
+                   (url, etag, last_modified, content_hash, size, time.time()))
+
+
+@connector
+def touch_entry(cursor, url):
+    cursor.execute("update http_cache set last_used = ? where url = ?", (time.time(), url))
+
+
+# This function removes the entries that were used longest ago from the index until the rest fit in the maximum size and returns their urls
+@connector
+def entries_to_evict(cursor, max_size):
+    cursor.execute("select coalesce(sum(size), 0) from http_cache")
+    total_size = cursor.fetchone()[0]
+    if total_size <= max_size:
+        return []
+    evicted = []
+    for url, size in cursor.execute("select url, size from http_cache order by last_used").fetchall():
+        if total_size <= max_size:
+            break
+        evicted.append(url)
+        total_size -= size
+    cursor.executemany("delete from http_cache where url = ?", [(url,) for url in evicted])
+    return evicted
+
+
+http_cache = HttpCache()
@@ -1,16 +1,77 @@
 import requests
-from bs4 import BeautifulSoup as bs
+from requests.adapters import HTTPAdapter
+from datetime import date, timedelta
+import threading
+import time
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import random
 import sqlite3
-import matplotlib.pyplot as plt
-import calendar
+import sys
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from collections import deque
+
+from database import connector, database, releasing_connection
+from exporter import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORT_WORKERS, ExportFilter, export_archive, export_articles
+from fingerprint import MIN_SIMILARITY, bands, signature, similarity
+from httpcache import http_cache
+from metrics import metrics, serve_metrics
+from parsing import article_paragraphs
+from plotting import PLOT_DIRECTORY, PLOT_FORMATS, plot_path, render_bars, render_trends
+from scrapers import SCRAPERS, normalize_url, scraper_for, site_of
+from textstore import compress_text, decompress_text, iter_rows
+from tokenizer import iter_bigrams, iter_words, separate_words
+from trends import Trends
+
+
+# These are the periods that the statistics can be grouped by and the format of their keys, the same formats work in sqlite's strftime and in python
+# A week is written as the date of its monday, a week number like %W starts a new week on the first of january and splits the week around new year in two
+PERIOD_FORMATS = {"day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+# These are the sqlite date modifiers that move a day to the first day of its period, the keys of a week are the same in sqlite, python and the trends
+PERIOD_MODIFIERS = {"day": [], "week": ["-6 days", "weekday 1"], "month": [], "year": []}
+
+# The scheduler and the scrape command take this lock so that two scrapes never run at the same time
+LOCK_FILE = "scrape.lock"
+# A lock file without a pid that is older than this was left behind by a process that stopped before it wrote its pid
+LOCK_WRITE_SECONDS = 2
+
+# This is how many articles the background backfill of the term index reads at a time
+BACKFILL_BATCH_SIZE = 500
+
+# These settings control how many articles are downloaded at the same time and how long a download may take
+FETCH_WORKERS = 16
+MAX_REQUESTS_PER_DOMAIN = 4
+REQUEST_TIMEOUT = 15
+
+# The scraped articles are written to the database in chunks of this size, so a crash only loses the chunk that was being collected
+SCRAPE_CHUNK_SIZE = 50
+# A url that fails to download is tried again after RETRY_BACKOFF seconds, then twice as long after every further failure, until it has failed MAX_FETCH_ATTEMPTS times
+MAX_FETCH_ATTEMPTS = 5
+RETRY_BACKOFF = 300
+
+# This is how many processes parse and categorize the downloaded articles, with 0 it is done in the main process
+PARSE_WORKERS = 0
+# The articles are sent to the worker processes in batches of this size, because sending them one by one costs more than parsing them
+PARSE_BATCH_SIZE = 16
+# The worker processes are started by a server process instead of being forked from this one, because forking while the download threads run can deadlock the new process
+# The search terms are sent to every worker when it starts, so nothing depends on what a fork would copy
+PARSE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
 
 
 # Having the search term and its category in one object makes it easier to categorize articles
 class SearchTerm:
 
-    def __init__(self, term, category):
+    def __init__(self, term, category, term_id=None):
         self.term = term
         self.category = category
+        self.term_id = term_id
 
 
 # Having an article object reduces the amount of code needed to categorize articles
@@ -20,111 +81,617 @@ class Article:
         self.url = url
         self.domain_id = domain_id
         self.text = ""
+        self.fingerprint = None
 
 
-# This decorator function handles the connection to the database
-def connector(function):
-    def wrapper(*args):
-        connection = sqlite3.connect("news.db")
-        cursor = connection.cursor()
-        cursor.execute("PRAGMA foreign_keys = True")
-        result = function(cursor, *args)
-        connection.commit()
-        cursor.close()
-        connection.close()
-        return result
+# The matcher is built once from the search terms so that every word only needs one dictionary lookup instead of a comparison with every search term
+class TermMatcher:
 
-    return wrapper
+    def __init__(self, search_terms):
+        self.search_terms = search_terms
+        # The keys are the terms themselves, two word terms can be looked up with the previous word and the current word joined by a space
+        self.index = {}
+        for search_term in search_terms:
+            self.index.setdefault(search_term.term, []).append(search_term)
 
+    # This function counts how many times each search term appears in a list of words, it can keep adding to the counts of an earlier call
+    def count_terms(self, words, term_counts=None):
+        if term_counts is None:
+            term_counts = {}
+        index = self.index
+        previous_word = ""
+        for word in words:
+            for key in (word, previous_word + " " + word):
+                if key in index:
+                    for search_term in index[key]:
+                        term_counts[search_term] = term_counts.get(search_term, 0) + 1
+            previous_word = word
+        return term_counts
 
-# This function scrapes article urls from the front page of reuters
-def scrape_reuters():
-    domain_url = "https://reuters.com"
-
-    response = requests.get(domain_url)
-
-    soup = bs(response.content, "html.parser")
-
-    with_picture = soup.find_all("div", attrs={"data-testid": "MediaStoryCard"})
-    no_picture = soup.find_all("div", attrs={"data-testid": "TextStoryCard"})
-
-    article_urls = set()
+    # This function adds up the term counts per category
+    @staticmethod
+    def count_categories(term_counts):
+        category_counter = {}
+        for search_term, count in term_counts.items():
+            category_counter[search_term.category] = category_counter.get(search_term.category, 0) + count
+        return category_counter
+
+    # This function returns the most commonly seen category or None if none of the search terms appeared
+    # When two categories are seen equally often the one with the lowest id wins, the same way recategorize_batch picks it in the database
+    @staticmethod
+    def best_category(category_counter):
+        if not category_counter:
+            return None
+        return max(category_counter.items(), key=lambda x: (x[1], -x[0]))[0]
+
+
+# The fetcher downloads many articles at the same time while never sending more than a few requests to one domain at once
+class Fetcher:
+
+    def __init__(self, workers=FETCH_WORKERS, per_domain=MAX_REQUESTS_PER_DOMAIN, timeout=REQUEST_TIMEOUT, cache=http_cache):
+        self.workers = workers
+        self.per_domain = per_domain
+        self.timeout = timeout
+        # The cache can be None to always download the whole page
+        self.cache = cache
+        # Every domain gets its own session so the connections to it are kept alive and reused between articles
+        self.sessions = {}
+        self.semaphores = {}
+        self.lock = threading.Lock()
+        # The scrapers can set their own limit on how many requests are sent to their site at the same time
+        self.domain_limits = {site_of(domain_url): definition.max_requests for domain_url, definition in SCRAPERS.items() if definition.max_requests}
+
+    # This function returns how many requests can be sent to the site at the same time
+    def site_limit(self, site):
+        return self.domain_limits.get(site, self.per_domain)
+
+    def get_session(self, site):
+        with self.lock:
+            if site not in self.sessions:
+                limit = self.site_limit(site)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[site] = session
+                self.semaphores[site] = threading.Semaphore(limit)
+            return self.sessions[site], self.semaphores[site]
+
+    def fetch(self, url):
+        return self.fetch_page(url)[0]
+
+    # This function returns the content of a page and whether it is the same as the last time it was downloaded
+    # The time of every download and the size of every page are kept in the metrics per site
+    # When confirm_later is True the page is only saved in the cache once confirm is called
+    def fetch_page(self, url, confirm_later=False):
+        site = site_of(url)
+        session, semaphore = self.get_session(site)
+        with semaphore, metrics.timer("fetch", site=site):
+            if self.cache is not None:
+                content, unchanged, received = self.cache.get(session, url, self.timeout, confirm_later)
+            else:
+                response = session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                content, unchanged, received = response.content, False, len(response.content)
+        # Only the bytes that came over the network are fetched, a page that the server says hasn't changed is read from the cache
+        metrics.count("bytes_fetched", received, site=site)
+        if len(content) > received:
+            metrics.count("bytes_from_cache", len(content) - received, site=site)
+        return content, unchanged
+
+    # This function yields every article together with its html and the error if the download failed, as soon as its download finishes
+    # The articles are queued per site and a download is only started when its site has a free slot, so no thread of the pool waits on a busy site while another site is idle
+    # The sites take turns, so the articles of every site are downloaded at the same time whatever order they come in
+    # Only as many downloads as there are workers run at once, so finished pages don't pile up in memory when the next stage is slower
+    def fetch_all(self, articles):
+        queues = {}
+        for article in articles:
+            queues.setdefault(site_of(article.url), deque()).append(article)
+        turns = deque(queues)
+        active = dict.fromkeys(queues, 0)
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        pending = {}
+        fetch = releasing_connection(self.fetch)
+
+        def start_downloads():
+            # full counts the sites in a row that had no free slot, once it has gone round every site nothing more can be started
+            full = 0
+            while turns and len(pending) < self.workers and full < len(turns):
+                site = turns[0]
+                turns.rotate(-1)
+                if active[site] >= self.site_limit(site):
+                    full += 1
+                    continue
+                full = 0
+                article = queues[site].popleft()
+                # The site that was just used is at the end of the turns
+                if not queues[site]:
+                    turns.pop()
+                active[site] += 1
+                pending[pool.submit(fetch, article.url)] = article
 
-    for article in with_picture:
-        if "https://www.reuters.com" in article.find("a", attrs={"data-testid": "Heading"})["href"]:
-            article_urls.add(article.find("a", attrs={"data-testid": "Heading"})["href"])
-        else:
-            article_urls.add(domain_url + article.find("a", attrs={"data-testid": "Heading"})["href"])
+        try:
+            start_downloads()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished = [(future, pending.pop(future)) for future in done]
+                for future, article in finished:
+                    active[site_of(article.url)] -= 1
+                start_downloads()
+                for future, article in finished:
+                    # Any error of one download, not only a network error, only fails that article so it is retried later
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        metrics.count("fetch_errors", site=site_of(article.url))
+                        yield article, None, error
+                        continue
+                    yield article, result, None
+        finally:
+            # If the pipeline stops early the downloads that haven't started yet are cancelled instead of waited for
+            pool.shutdown(wait=False, cancel_futures=True)
 
-    for article in no_picture:
-        if "https://www.reuters.com" in article.find("a", attrs={"data-testid": "Heading"})["href"]:
-            article_urls.add(article.find("a", attrs={"data-testid": "Heading"})["href"])
-        else:
-            article_urls.add(domain_url + article.find("a", attrs={"data-testid": "Heading"})["href"])
+    def confirm(self, url):
+        if self.cache is not None:
+            self.cache.confirm(url)
 
-    add_urls(article_urls, domain_url)
+    def discard(self, url):
+        if self.cache is not None:
+            self.cache.discard(url)
 
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        self.semaphores.clear()
 
-# This function scrapes article urls from the front page of apnews
-def scrape_ap():
-    domain_url = "https://apnews.com"
 
-    response = requests.get(domain_url)
+# This function checks if a table is already in the database
+def table_exists(cursor, name):
+    cursor.execute("select count(*) from sqlite_master where type = 'table' and name = ?", (name,))
+    return cursor.fetchone()[0] == 1
 
-    soup = bs(response.content, "html.parser")
 
-    main_story = soup.find("div", attrs={"data-tb-region": "Top Stories"})
-    feed = soup.find_all("div", attrs={"data-key": "feed-card-hub-peak"})
+# The front pages are downloaded through their own fetcher so that the connection to each news site is kept alive between scrapes
+front_page_fetcher = Fetcher()
 
-    article_urls = set()
 
-    for thing in main_story.find_all("a", attrs={"data-key": "card-headline"}):
-        if "?" in thing["href"]:
-            article_urls.add(domain_url + thing["href"].split("?")[0])
-        else:
-            article_urls.add(domain_url + thing["href"])
+# This function creates the tables if they don't exist yet, term_hits stores how many times each search term appears in each article so that the statistics don't have to read the article texts again
+@connector
+def setup_database(cursor):
+    has_known_urls = table_exists(cursor, "known_urls")
+    has_daily_counts = table_exists(cursor, "daily_article_counts")
+    has_article_texts = table_exists(cursor, "article_texts")
+    # sqlite3 only starts a transaction by itself before inserts and updates, so it is started here to make the new tables part of the same unit of work
+    if not cursor.connection.in_transaction:
+        cursor.execute("begin")
+    database.execute_script(cursor, """
+        create table if not exists domains (id integer primary key, domain text);
+        create table if not exists categories (id integer primary key, category text);
+        create table if not exists search_terms (id integer primary key, category_id integer references categories(id), term text);
+        create table if not exists unscraped_articles (id integer primary key, domain_id integer references domains(id), url text);
+        create table if not exists scraped_articles (id integer primary key, domain_id integer references domains(id), url text, text text, category_id integer references categories(id), date text default (date('now')));
+        create index if not exists scraped_articles_date on scraped_articles (date);
+        -- The texts are stored compressed in their own table so that the queries on the other columns of scraped_articles never have to read them, the text column is left empty
+        create table if not exists article_texts (article_id integer primary key references scraped_articles(id) on delete cascade, text blob not null);
+
+        -- The full text index of the articles, the rowid is the id of the article
+        -- It is contentless because the texts are already in article_texts, so a text has to be given again to remove it from the index
+        -- The texts are indexed by save_article_texts, the triggers below don't decompress anything so the database works in any sqlite program
+        create virtual table if not exists article_search using fts5(text, content='');
+        -- A text that is changed or deleted outside of save_article_texts, for example in the sqlite3 shell, is put here still compressed
+        -- sync_article_search takes its old words out of the index and puts the new ones in
+        create table if not exists article_search_changes (id integer primary key, article_id integer not null, old_text blob, new_text blob);
+
+        -- The minhash signature of every article, it is null for the articles that are too short to be compared
+        create table if not exists article_fingerprints (article_id integer primary key references scraped_articles(id) on delete cascade, signature blob);
+        -- Every band of a fingerprint is indexed on its own, so the articles that could be the same story are found without comparing every fingerprint
+        create table if not exists fingerprint_bands (
+            band integer not null,
+            value integer not null,
+            article_id integer not null references scraped_articles(id) on delete cascade,
+            primary key (band, value, article_id)
+        ) without rowid;
+        create index if not exists fingerprint_bands_article on fingerprint_bands (article_id);
+        -- The articles that were stored before the fingerprints existed are fingerprinted in the background, this is how far that has got
+        -- New articles are fingerprinted when they are stored, so once it is done it never has to run again
+        create table if not exists fingerprint_backfill (
+            id integer primary key check (id = 1),
+            last_article_id integer not null default 0,
+            done integer not null default 0
+        );
+        insert or ignore into fingerprint_backfill (id) values (1);
+        -- The urls whose text was almost the same as an article that was already stored, they are linked to that article instead of being stored and counted again
+        create table if not exists duplicate_articles (
+            url text primary key,
+            domain_id integer references domains(id),
+            canonical_id integer not null references scraped_articles(id) on delete cascade,
+            similarity real not null,
+            date text default (date('now'))
+        );
+        create trigger if not exists article_texts_search_delete_queue after delete on article_texts begin
+            insert into article_search_changes (article_id, old_text) values (old.article_id, old.text);
+        end;
+        create trigger if not exists article_texts_search_update_queue after update of text on article_texts begin
+            insert into article_search_changes (article_id, old_text, new_text) values (old.article_id, old.text, new.text);
+        end;
+        create index if not exists scraped_articles_url on scraped_articles (url);
+        create index if not exists unscraped_articles_url on unscraped_articles (url);
+
+        create table if not exists known_urls (url text primary key) without rowid;
+
+        create table if not exists http_cache (
+            url text primary key,
+            etag text,
+            last_modified text,
+            content_hash text not null,
+            size integer not null,
+            last_used real not null
+        );
+        create index if not exists http_cache_last_used on http_cache (last_used);
+
+        create table if not exists fetch_failures (
+            url text primary key,
+            attempts integer not null,
+            last_error text,
+            retry_after real not null
+        ) without rowid;
+
+        create table if not exists term_hits (
+            article_id integer not null references scraped_articles(id) on delete cascade,
+            term_id integer not null references search_terms(id) on delete cascade,
+            count integer not null,
+            date text not null,
+            primary key (article_id, term_id)
+        ) without rowid;
+        create index if not exists term_hits_term_date on term_hits (term_id, date);
+
+        -- These tables have the counts per day, the triggers keep them up to date whenever articles or term hits are added, changed or removed
+        create table if not exists daily_article_counts (day text primary key, count integer not null) without rowid;
+        create table if not exists daily_category_counts (category_id integer not null, day text not null, count integer not null, primary key (category_id, day)) without rowid;
+        create table if not exists daily_term_counts (term_id integer not null, day text not null, count integer not null, primary key (term_id, day)) without rowid;
+
+        create trigger if not exists scraped_articles_counts_insert after insert on scraped_articles begin
+            insert into daily_article_counts (day, count) values (new.date, 1)
+                on conflict (day) do update set count = count + 1;
+            insert into daily_category_counts (category_id, day, count) select new.category_id, new.date, 1 where new.category_id is not null
+                on conflict (category_id, day) do update set count = count + 1;
+        end;
+        create trigger if not exists scraped_articles_counts_delete after delete on scraped_articles begin
+            update daily_article_counts set count = count - 1 where day = old.date;
+            update daily_category_counts set count = count - 1 where category_id = old.category_id and day = old.date;
+        end;
+        create trigger if not exists scraped_articles_counts_update after update of category_id, date on scraped_articles begin
+            update daily_article_counts set count = count - 1 where day = old.date;
+            update daily_category_counts set count = count - 1 where category_id = old.category_id and day = old.date;
+            insert into daily_article_counts (day, count) values (new.date, 1)
+                on conflict (day) do update set count = count + 1;
+            insert into daily_category_counts (category_id, day, count) select new.category_id, new.date, 1 where new.category_id is not null
+                on conflict (category_id, day) do update set count = count + 1;
+        end;
+
+        create trigger if not exists term_hits_counts_insert after insert on term_hits begin
+            insert into daily_term_counts (term_id, day, count) values (new.term_id, new.date, new.count)
+                on conflict (term_id, day) do update set count = count + excluded.count;
+        end;
+        create trigger if not exists term_hits_counts_delete after delete on term_hits begin
+            update daily_term_counts set count = count - old.count where term_id = old.term_id and day = old.date;
+        end;
+        create trigger if not exists term_hits_counts_update after update on term_hits begin
+            update daily_term_counts set count = count - old.count where term_id = old.term_id and day = old.date;
+            insert into daily_term_counts (term_id, day, count) values (new.term_id, new.date, new.count)
+                on conflict (term_id, day) do update set count = count + excluded.count;
+        end;
+
+        create index if not exists scraped_articles_category on scraped_articles (category_id);
+
+        -- These are the articles whose category may have changed because of a search term that was added or removed
+        create table if not exists recategorize_queue (article_id integer primary key references scraped_articles(id) on delete cascade);
+
+        create table if not exists term_backfill (
+            term_id integer primary key references search_terms(id) on delete cascade,
+            last_article_id integer not null default 0,
+            done integer not null default 0
+        );
+    """)
+    # Search terms that were added before the index existed have to be backfilled from the stored articles
+    cursor.execute("insert or ignore into term_backfill (term_id) select id from search_terms")
+    # The counts of the articles that were saved before the daily tables existed are added once
+    if not has_daily_counts:
+        cursor.execute("insert into daily_article_counts (day, count) select date, count(*) from scraped_articles group by date")
+        cursor.execute("insert into daily_category_counts (category_id, day, count) "
+                       "select category_id, date, count(*) from scraped_articles where category_id is not null group by category_id, date")
+        cursor.execute("insert into daily_term_counts (term_id, day, count) select term_id, date, sum(count) from term_hits group by term_id, date")
+    # The urls that were saved before known_urls existed are added once, in both the way they were saved and the normalized way
+    if not has_known_urls:
+        urls = cursor.execute("select url from unscraped_articles union select url from scraped_articles").fetchall()
+        cursor.executemany("insert or ignore into known_urls (url) values (?)", urls)
+        cursor.executemany("insert or ignore into known_urls (url) values (?)", [(normalize_url(row[0]),) for row in urls])
+    # The texts that were saved before article_texts existed are compressed and moved there once
+    if not has_article_texts:
+        save_article_texts(cursor, iter_rows(cursor.connection.execute("select id, text from scraped_articles where text is not null")))
+        cursor.execute("update scraped_articles set text = null where text is not null")
+    sync_article_search()
+
+
+# This function saves the texts of articles compressed in article_texts and adds their words to the full text index, the rows are (article id, text)
+def save_article_texts(cursor, rows):
+    for article_id, text in rows:
+        cursor.execute("insert into article_texts (article_id, text) values (?, ?)", (article_id, compress_text(text)))
+        cursor.execute("insert into article_search (rowid, text) values (?, ?)", (article_id, text))
+
+
+# This function brings the full text index up to date with the texts that were changed or deleted since it last ran
+@connector
+def sync_article_search(cursor):
+    changes = cursor.execute("select id, article_id, old_text, new_text from article_search_changes order by id").fetchall()
+    for change_id, article_id, old_text, new_text in changes:
+        if old_text is not None:
+            cursor.execute("insert into article_search (article_search, rowid, text) values ('delete', ?, ?)", (article_id, decompress_text(old_text)))
+        if new_text is not None:
+            cursor.execute("insert into article_search (rowid, text) values (?, ?)", (article_id, decompress_text(new_text)))
+    if changes:
+        cursor.execute("delete from article_search_changes where id <= ?", (changes[-1][0],))
+
+
+# This function stores the search term counts of an article in the term index
+def insert_term_hits(cursor, article_id, term_counts):
+    # An upsert is used instead of insert or replace, because replacing a row doesn't run the delete trigger that keeps daily_term_counts right
+    cursor.executemany("insert into term_hits (article_id, term_id, count, date) "
+                       "select ?, ?, ?, date from scraped_articles where id = ? "
+                       "on conflict (article_id, term_id) do update set count = excluded.count",
+                       [(article_id, search_term.term_id, count, article_id) for search_term, count in term_counts.items()])
+
+
+# This function fetches the search terms that still have to be backfilled and the article id that each of them has reached
+@connector
+def pending_backfill(cursor):
+    search_terms = []
+    for row in cursor.execute("select search_terms.id, search_terms.category_id, search_terms.term, term_backfill.last_article_id "
+                              "from term_backfill join search_terms on search_terms.id = term_backfill.term_id "
+                              "where term_backfill.done = 0"):
+        search_terms.append((SearchTerm(row[2].lower(), row[1], row[0]), row[3]))
+    return search_terms
 
-    for thing in feed:
-        for stuff in thing.find_all("li"):
-            try:
-                if "?" in stuff.find("a")["href"]:
-                    article_urls.add(domain_url + stuff.find("a")["href"].split("?")[0])
-                else:
-                    article_urls.add(domain_url + stuff.find("a")["href"])
-            except Exception:
-                pass
 
-    add_urls(article_urls, domain_url)
+# This function counts the pending search terms in one batch of stored articles and returns the id of the last article or None when there are no articles left
+@connector
+def backfill_batch(cursor, search_terms, after_article_id):
+    rows = cursor.execute("select article_id, text from article_texts where article_id > ? order by article_id limit ?",
+                          (after_article_id, BACKFILL_BATCH_SIZE)).fetchall()
+    term_ids = [(search_term.term_id,) for search_term in search_terms]
+    if not rows:
+        cursor.executemany("update term_backfill set done = 1 where term_id = ?", term_ids)
+        return None
+    matcher = TermMatcher(search_terms)
+    for article_id, text in rows:
+        term_counts = matcher.count_terms(iter_words(decompress_text(text)))
+        insert_term_hits(cursor, article_id, term_counts)
+        # Only the articles that have one of the new terms in them can get a different category
+        if term_counts:
+            cursor.execute("insert or ignore into recategorize_queue (article_id) values (?)", (article_id,))
+    cursor.executemany("update term_backfill set last_article_id = ? where term_id = ?",
+                       [(rows[-1][0], term_id[0]) for term_id in term_ids])
+    return rows[-1][0]
+
+
+backfill_lock = threading.Lock()
+
+
+# This function fills the term index for search terms that were added after articles had already been scraped, it saves its progress after every batch so it can continue where it stopped
+def backfill_term_hits():
+    with backfill_lock:
+        pending = pending_backfill()
+        if not pending:
+            return
+        search_terms = [search_term for search_term, last_article_id in pending]
+        # Terms that are further ahead get their counts replaced with the same values, so it is safe to start from the one that is furthest behind
+        after_article_id = min(last_article_id for search_term, last_article_id in pending)
+        while after_article_id is not None:
+            after_article_id = backfill_batch(search_terms, after_article_id)
 
 
-# This function removes punctuation and splits text in to a list of words so that I can search the list for search terms
-def separate_words(words):
-    separated = words.replace(",", "").replace(".", "").replace('“', "").replace("’", " ").replace("‘", "").replace("-", " ").replace("”", "").replace('"', "").replace("'", " ").replace(":", "").replace("/", " ").lower().split()
-    return separated
+# This function works out the category of a batch of queued articles again from the term index and returns how many articles it did
+@connector
+def recategorize_batch(cursor):
+    article_ids = [row[0] for row in cursor.execute("select article_id from recategorize_queue limit ?", (BACKFILL_BATCH_SIZE,))]
+    if not article_ids:
+        return 0
+    categories = dict.fromkeys(article_ids)
+    cursor.execute("create temp table if not exists recategorize_batch_ids (article_id integer primary key)")
+    cursor.execute("delete from recategorize_batch_ids")
+    cursor.executemany("insert into recategorize_batch_ids (article_id) values (?)", [(article_id,) for article_id in article_ids])
+    # The rows are sorted so that the first row of every article has its most common category, with the lowest category id winning a tie
+    for article_id, category_id, hits in cursor.execute("select term_hits.article_id, search_terms.category_id, sum(term_hits.count) as hits from term_hits "
+                                                        "join search_terms on search_terms.id = term_hits.term_id "
+                                                        "where term_hits.article_id in (select article_id from recategorize_batch_ids) "
+                                                        "group by 1, 2 order by 1, hits desc, 2").fetchall():
+        if categories[article_id] is None:
+            categories[article_id] = category_id
+    # Only the articles whose category really changes are updated, so the daily category counts aren't touched for the rest
+    cursor.executemany("update scraped_articles set category_id = ? where id = ? and category_id is not ?",
+                       [(category_id, article_id, category_id) for article_id, category_id in categories.items()])
+    cursor.execute("delete from recategorize_queue where article_id in (select article_id from recategorize_batch_ids)")
+    cursor.execute("delete from recategorize_batch_ids")
+    return len(article_ids)
+
+
+# This function recategorizes all of the queued articles, one batch at a time
+def recategorize_articles():
+    with backfill_lock:
+        while recategorize_batch():
+            pass
+
+
+# This function returns the id of the stored article that is the same story as the signature and how similar they are, or None if there isn't one
+# When several articles are similar enough the most similar one wins, and the oldest one of those
+def find_duplicate(cursor, article_signature):
+    candidates = set()
+    for band, value in bands(article_signature):
+        candidates.update(cursor.execute("select article_fingerprints.article_id, article_fingerprints.signature from fingerprint_bands "
+                                         "join article_fingerprints on article_fingerprints.article_id = fingerprint_bands.article_id "
+                                         "where fingerprint_bands.band = ? and fingerprint_bands.value = ?", (band, value)).fetchall())
+    best = None
+    for article_id, other in candidates:
+        share = similarity(article_signature, other)
+        if share >= MIN_SIMILARITY and (best is None or (-share, article_id) < (-best[1], best[0])):
+            best = (article_id, share)
+    return best
+
+
+# This function stores the signature of an article and its bands
+def save_fingerprint(cursor, article_id, article_signature):
+    cursor.execute("insert or replace into article_fingerprints (article_id, signature) values (?, ?)", (article_id, article_signature))
+    if article_signature is not None:
+        cursor.executemany("insert or ignore into fingerprint_bands (band, value, article_id) values (?, ?, ?)",
+                           [(band, value, article_id) for band, value in bands(article_signature)])
+
+
+# This function fingerprints one batch of the articles that were stored before the fingerprints existed and returns the id of the last one, or None when they are all done
+# These articles are only added to the index so new copies of them are found, the old copies are left as they are
+@connector
+def backfill_fingerprints_batch(cursor):
+    cursor.execute("select last_article_id, done from fingerprint_backfill")
+    after_article_id, done = cursor.fetchone()
+    if done:
+        return None
+    rows = cursor.execute("select article_texts.article_id, article_texts.text from article_texts "
+                          "left join article_fingerprints on article_fingerprints.article_id = article_texts.article_id "
+                          "where article_texts.article_id > ? and article_fingerprints.article_id is null order by article_texts.article_id limit ?",
+                          (after_article_id, BACKFILL_BATCH_SIZE)).fetchall()
+    if not rows:
+        cursor.execute("update fingerprint_backfill set done = 1")
+        return None
+    for article_id, text in rows:
+        save_fingerprint(cursor, article_id, signature(decompress_text(text)))
+    cursor.execute("update fingerprint_backfill set last_article_id = ?", (rows[-1][0],))
+    return rows[-1][0]
+
+
+# This function fingerprints the old articles, it saves its progress after every batch so it continues where it stopped and does nothing once every article has a fingerprint
+def backfill_fingerprints():
+    with backfill_lock:
+        while backfill_fingerprints_batch() is not None:
+            pass
+
+
+# This function brings the term index and the article categories up to date after search terms have been added or removed
+def update_term_index():
+    sync_article_search()
+    backfill_term_hits()
+    recategorize_articles()
+    backfill_fingerprints()
+
+
+# This function runs the backfill and the recategorization in a background thread so that the menu doesn't have to wait for them
+def start_backfill():
+    thread = threading.Thread(target=releasing_connection(update_term_index), daemon=True)
+    thread.start()
+    return thread
+
+
+# This function checks if the search terms with these ids, or every search term when no ids are given, have been counted in every stored article
+@connector
+def term_index_ready(cursor, term_ids=None):
+    if term_ids is None:
+        cursor.execute("select count(*) from term_backfill where done = 0")
+    else:
+        term_ids = list(term_ids)
+        cursor.execute(f"select count(*) from term_backfill where done = 0 and term_id in ({','.join('?' * len(term_ids))})", term_ids)
+    return cursor.fetchone()[0] == 0
 
 
-# This function adds the scraped urls into the database, but it first makes sure that the url hasn't already been saved
+# This function adds the scraped urls into the database, the known_urls table has every url that has ever been saved so the database can skip the old ones
 @connector
 def add_urls(cursor, article_urls, domain_url):
-    old_articles = []
-    checked_urls = []
+    cursor.execute("select id from domains where domain = ?", (domain_url,))
+    domain_id = cursor.fetchone()[0]
 
-    for row in cursor.execute("select url from unscraped_articles"):
-        old_articles.append(row[0])
+    cursor.execute("create temp table if not exists incoming_urls (url text primary key) without rowid")
+    cursor.execute("delete from incoming_urls")
+    cursor.executemany("insert or ignore into incoming_urls (url) values (?)", [(normalize_url(url),) for url in article_urls])
+    # Each new url is looked up in the primary key of known_urls, so this doesn't get slower as more articles are saved
+    cursor.execute("insert into unscraped_articles (domain_id, url) "
+                   "select ?, url from incoming_urls where url not in (select url from known_urls)", (domain_id,))
+    cursor.execute("insert or ignore into known_urls (url) select url from incoming_urls")
+    cursor.execute("delete from incoming_urls")
 
-    for row in cursor.execute("select url from scraped_articles"):
-        old_articles.append(row[0])
 
-    for art in article_urls:
-        if art not in old_articles:
-            checked_urls.append(art)
+# This function downloads the front page of a domain and returns the urls of its articles, the list is empty if the page hasn't changed since the last scrape
+# The front page is only saved in the cache after its urls have been added, otherwise a front page that failed would be skipped as unchanged in the next round
+def scrape_front_page(domain_url, fetcher):
+    content, unchanged = fetcher.fetch_page(domain_url, confirm_later=True)
+    if unchanged:
+        return set()
+    with metrics.timer("front_page_parse", site=site_of(domain_url)):
+        return scraper_for(domain_url).find_urls(domain_url, content)
 
-    cursor.execute(f"select id from domains where domain = '{domain_url}'")
-    domain_id = cursor.fetchone()[0]
 
-    for url in checked_urls:
-        cursor.execute("insert into unscraped_articles (domain_id, url) values (?, ?)", (domain_id, url))
-        
+# This function fetches every domain in the domains table
+@connector
+def load_domains(cursor):
+    return [row[0] for row in cursor.execute("select domain from domains")]
+
+
+# This function scrapes the front pages of every domain in the domains table at the same time and adds their article urls to the database
+# It returns the error of every domain whose front page failed, the errors are logged instead of printed so the output of the scrape command stays json
+def scrape_front_pages(fetcher=front_page_fetcher):
+    domains = load_domains()
+    failures = {}
+    if not domains:
+        return failures
+    with ThreadPoolExecutor(max_workers=len(domains)) as pool:
+        futures = {pool.submit(releasing_connection(scrape_front_page), domain_url, fetcher): domain_url for domain_url in domains}
+        for future in as_completed(futures):
+            domain_url = futures[future]
+            try:
+                # The urls are added here so that only this thread writes to the database
+                add_urls(future.result(), domain_url)
+            # One site that fails, whether it is the download, the parser or the database, doesn't stop the other sites from being scraped
+            except Exception as error:
+                if isinstance(error, requests.RequestException):
+                    logging.getLogger("scraper").warning("Couldn't scrape %s: %s", domain_url, error)
+                else:
+                    logging.getLogger("scraper").exception("Couldn't scrape %s", domain_url)
+                metrics.count("front_page_errors", site=site_of(domain_url))
+                failures[domain_url] = str(error)
+                fetcher.discard(domain_url)
+                continue
+            fetcher.confirm(domain_url)
+    return failures
+
+
+# This function does one whole scrape, first every front page and then one pass that downloads the articles of all of the domains together
+# The fetcher gives every site its own turns in that pass, so it takes about as long as the slowest site whatever order the urls were added in
+def scrape_round(workers=PARSE_WORKERS):
+    with metrics.timer("front_pages"):
+        front_page_errors = scrape_front_pages()
+    with metrics.timer("articles"):
+        totals = scrape_articles(workers=workers)
+    totals["front_page_errors"] = front_page_errors
+    return totals
+
+
+# This function runs one scrape round under cProfile and tracemalloc, the profile is saved to the file and the lines that allocated the most memory to the same file with .memory.txt added
+# Profiling makes the round a lot slower, so it is only done when it is asked for
+def profile_round(path, workers=PARSE_WORKERS):
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        totals = profiler.runcall(scrape_round, workers)
+        memory = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    profiler.dump_stats(path)
+    with open(path + ".memory.txt", "w") as file:
+        file.write(f"Current memory {current / 1e6:.1f} MB, peak memory {peak / 1e6:.1f} MB\n")
+        for statistic in memory.statistics("lineno")[:25]:
+            file.write(f"{statistic}\n")
+    totals["profile"] = path
+    totals["peak_memory"] = peak
+    return totals
+
 
 # This function adds a search term to the database and makes sure that the search term doesn't already exist
 @connector
@@ -134,6 +701,30 @@ def add_term(cursor, term, category_id):
             print("That search term already exists")
             return
     cursor.execute("insert into search_terms (category_id, term) values (?, ?)", (category_id, term))
+    # The new term has to be counted in the articles that are already stored before the index can be used for it
+    cursor.execute("insert into term_backfill (term_id) values (?)", (cursor.lastrowid,))
+    return True
+
+
+# This function removes a search term, the articles that had it in them are queued to be recategorized without it
+# The backfill lock is held so that a backfill that is running doesn't count the term again after it is removed or recategorize the articles with it
+def remove_term(term):
+    with backfill_lock:
+        return delete_term(term)
+
+
+@connector
+def delete_term(cursor, term):
+    cursor.execute("select id from search_terms where term = ?", (term,))
+    row = cursor.fetchone()
+    if row is None:
+        print("That search term doesn't exist")
+        return
+    term_id = row[0]
+    cursor.execute("insert or ignore into recategorize_queue (article_id) select article_id from term_hits where term_id = ?", (term_id,))
+    cursor.execute("delete from daily_term_counts where term_id = ?", (term_id,))
+    cursor.execute("delete from search_terms where id = ?", (term_id,))
+    return True
 
 
 # This function adds a category to the database and makes sure that the category doesn't already exist
@@ -156,153 +747,387 @@ def add_domain(cursor, domain):
     cursor.execute("insert into domains (domain) values (?)", (domain,))
 
 
-# This function scrapes the articles and categorizes them
+# This function fetches the search terms with their ids
 @connector
-def scrape_articles(cursor):
+def load_search_terms(cursor):
     search_terms = []
-    for row in cursor.execute("select category_id, term from search_terms"):
-        search_terms.append(SearchTerm(row[1].lower(), row[0]))
+    for row in cursor.execute("select id, category_id, term from search_terms"):
+        search_terms.append(SearchTerm(row[2].lower(), row[1], row[0]))
+    return search_terms
 
+
+# This function fetches the articles that are waiting to be scraped, leaving out the ones that failed recently or too many times
+@connector
+def load_unscraped_articles(cursor):
     articles = []
-    for row in cursor.execute("select url, domain_id from unscraped_articles"):
+    for row in cursor.execute("select unscraped_articles.url, unscraped_articles.domain_id from unscraped_articles "
+                              "left join fetch_failures on fetch_failures.url = unscraped_articles.url "
+                              "where fetch_failures.url is null or (fetch_failures.attempts < ? and fetch_failures.retry_after <= ?)",
+                              (MAX_FETCH_ATTEMPTS, time.time())):
         articles.append(Article(row[0], row[1]))
+    return articles
 
-    scraped_articles = []
-    for article in articles:
-        article_content = requests.get(article.url)
-        soup = bs(article_content.content, "html.parser")
-        paragraphs = soup.find_all("p")
-        # This dictionary stores the categories in the keys and their appearances in the values
-        category_counter = {}
-        for par in paragraphs:
-            article.text += par.text + " "
-            words = separate_words(par.text)
-            previous_word = ""
-            for word in words:
-                for search_term in search_terms:
-                    if word == search_term.term or previous_word + " " + word == search_term.term:
-                        try:
-                            category_counter[search_term.category] += 1
-                        except KeyError:
-                            category_counter[search_term.category] = 1
-                previous_word = word
-        # This sorts the dictionary based on the key values and returns a list of tuples
-        sorted_categories = sorted(category_counter.items(), key=lambda x: x[1], reverse=True)
+
+# This generator takes the downloaded articles and yields the paragraphs of each one
+def parse_articles(fetched):
+    for article, content, error in fetched:
+        if error is not None:
+            yield article, None, error
+            continue
         try:
-            # The most commonly seen category will be the first element in the tuple in the first position of the list
-            category = sorted_categories[0][0]
-        except IndexError:
-            category = None
-        scraped_articles.append((article.domain_id, article.url, article.text, category))
-    cursor.execute("delete from unscraped_articles")
-    cursor.executemany("insert into scraped_articles (domain_id, url, text, category_id) values (?,?,?,?)", scraped_articles)
-    
+            with metrics.timer("parse"):
+                paragraphs = article_paragraphs(content)
+        except Exception as error:
+            yield article, None, error
+            continue
+        yield article, paragraphs, None
+
+
+# This function joins the paragraphs into the article text and counts the search terms in them
+def categorize_paragraphs(paragraphs, matcher):
+    # This dictionary stores the search terms in the keys and their appearances in the values
+    term_counts = {}
+    for par in paragraphs:
+        matcher.count_terms(separate_words(par), term_counts)
+    category = matcher.best_category(matcher.count_categories(term_counts))
+    return "".join(par + " " for par in paragraphs), category, term_counts
+
+
+# This generator takes the parsed articles, fills in their text and yields their category and search term counts
+def categorize_articles(parsed, matcher):
+    for article, paragraphs, error in parsed:
+        if error is not None:
+            yield article, None, None, error
+            continue
+        with metrics.timer("match"):
+            article.text, category, term_counts = categorize_paragraphs(paragraphs, matcher)
+        with metrics.timer("fingerprint"):
+            article.fingerprint = signature(article.text)
+        yield article, category, term_counts, None
+
+
+# Every worker process builds its own matcher once when it starts, so the search terms aren't sent along with every article
+worker_matcher = None
+
+
+def init_parse_worker(search_terms):
+    global worker_matcher
+    worker_matcher = TermMatcher(search_terms)
+
+
+# This function runs in a worker process, it gets the html of some articles and returns the text, the category and the search term counts by term id of each one
+# The parse and match times are sent back with every article, because the metrics of a worker process aren't seen by the process that reports them
+# A page that can't be handled gets its error back instead, so the other articles of the batch are still saved
+def parse_and_categorize(pages):
+    results = []
+    for html in pages:
+        try:
+            start = time.perf_counter()
+            paragraphs = article_paragraphs(html)
+            parsed = time.perf_counter()
+            text, category, term_counts = categorize_paragraphs(paragraphs, worker_matcher)
+            matched = time.perf_counter()
+            fingerprint = signature(text)
+        except Exception as error:
+            results.append(error)
+            continue
+        results.append((text, category, {search_term.term_id: count for search_term, count in term_counts.items()}, fingerprint,
+                        parsed - start, matched - parsed, time.perf_counter() - matched))
+    return results
+
+
+# This generator does the parse and categorize stages in a pool of processes so that they can use more than one core
+# The results come back to the process that called it, which is the only one that writes to the database
+def categorize_articles_in_pool(fetched, matcher, workers, batch_size=PARSE_BATCH_SIZE):
+    terms_by_id = {search_term.term_id: search_term for search_term in matcher.search_terms}
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD),
+                               initializer=init_parse_worker, initargs=(matcher.search_terms,))
+    pending = {}
+    batch = []
+
+    def finished(futures):
+        for future in futures:
+            for article, result in zip(pending.pop(future), future.result()):
+                if isinstance(result, Exception):
+                    yield article, None, None, result
+                    continue
+                text, category, term_counts, fingerprint, parse_seconds, match_seconds, fingerprint_seconds = result
+                article.text = text
+                article.fingerprint = fingerprint
+                metrics.observe("parse", parse_seconds)
+                metrics.observe("match", match_seconds)
+                metrics.observe("fingerprint", fingerprint_seconds)
+                yield article, category, {terms_by_id[term_id]: count for term_id, count in term_counts.items()}, None
+
+    try:
+        for article, content, error in fetched:
+            if error is not None:
+                yield article, None, None, error
+                continue
+            batch.append((article, content))
+            if len(batch) < batch_size:
+                continue
+            pending[pool.submit(parse_and_categorize, [content for article, content in batch])] = [article for article, content in batch]
+            batch = []
+            # Only a couple of batches per worker are waiting at a time, so the downloaded pages don't pile up in memory
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        if batch:
+            pending[pool.submit(parse_and_categorize, [content for article, content in batch])] = [article for article, content in batch]
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from finished(done)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# This function saves one chunk of scraped articles, each url is only removed from unscraped_articles in the same transaction that stores its article
+# An article that is the same story as one that is already stored is only linked to it, and the amount of those is returned
+@connector
+def store_articles(cursor, scraped, failed):
+    duplicates = 0
+    for article, category, term_counts in scraped:
+        duplicate = None if article.fingerprint is None else find_duplicate(cursor, article.fingerprint)
+        if duplicate is not None:
+            cursor.execute("insert or ignore into duplicate_articles (url, domain_id, canonical_id, similarity) values (?, ?, ?, ?)",
+                           (article.url, article.domain_id) + duplicate)
+            duplicates += 1
+        else:
+            cursor.execute("insert into scraped_articles (domain_id, url, category_id) values (?,?,?)",
+                           (article.domain_id, article.url, category))
+            article_id = cursor.lastrowid
+            save_article_texts(cursor, [(article_id, article.text)])
+            insert_term_hits(cursor, article_id, term_counts)
+            save_fingerprint(cursor, article_id, article.fingerprint)
+        cursor.execute("delete from unscraped_articles where url = ?", (article.url,))
+        cursor.execute("delete from fetch_failures where url = ?", (article.url,))
+    # Every failure doubles the time until the url is tried again
+    cursor.executemany("insert into fetch_failures (url, attempts, last_error, retry_after) values (?, 1, ?, ?) "
+                       "on conflict (url) do update set attempts = attempts + 1, last_error = excluded.last_error, "
+                       "retry_after = ? + ? * (1 << attempts)",
+                       [(article.url, str(error), time.time() + RETRY_BACKOFF, time.time(), RETRY_BACKOFF) for article, error in failed])
+    return duplicates
+
+
+# This function saves a chunk of articles, adds them to the totals and keeps how long the write took
+def save_chunk(scraped, failed, totals):
+    with metrics.timer("write"):
+        duplicates = store_articles(scraped, failed)
+    totals["scraped"] += len(scraped) - duplicates
+    totals["duplicates"] += duplicates
+    totals["failed"] += len(failed)
+    metrics.count("articles_scraped", len(scraped) - duplicates)
+    metrics.count("articles_duplicate", duplicates)
+    metrics.count("articles_failed", len(failed))
+
+
+# This function scrapes the articles and categorizes them, the articles go through the download, parse and categorize stages one at a time and are saved in chunks
+# If it is interrupted the finished articles are still saved and the rest of the articles stay in unscraped_articles, so the next run continues where this one stopped
+def scrape_articles(fetcher=None, chunk_size=SCRAPE_CHUNK_SIZE, workers=PARSE_WORKERS):
+    matcher = TermMatcher(load_search_terms())
+    articles = load_unscraped_articles()
+
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher()
+
+    scraped = []
+    failed = []
+    totals = {"scraped": 0, "duplicates": 0, "failed": 0}
+    start = time.perf_counter()
+    if workers:
+        categorized = categorize_articles_in_pool(fetcher.fetch_all(articles), matcher, workers)
+    else:
+        categorized = categorize_articles(parse_articles(fetcher.fetch_all(articles)), matcher)
+
+    try:
+        for article, category, term_counts, error in categorized:
+            if error is None:
+                scraped.append((article, category, term_counts))
+            else:
+                failed.append((article, error))
+            if len(scraped) + len(failed) >= chunk_size:
+                # The chunk is taken out before it is saved, so a chunk that couldn't be saved is never saved again
+                chunk, scraped, failed = (scraped, failed), [], []
+                save_chunk(*chunk, totals)
+        chunk, scraped, failed = (scraped, failed), [], []
+        save_chunk(*chunk, totals)
+    except BaseException:
+        # The articles that were finished before the scrape stopped are saved once, an error while saving them is logged so the error that stopped the scrape is the one that is raised
+        if scraped or failed:
+            try:
+                save_chunk(scraped, failed, totals)
+            except Exception:
+                logging.getLogger("scraper").exception("Couldn't save the articles that were finished before the scrape stopped")
+        raise
+    finally:
+        if own_fetcher:
+            fetcher.close()
+        seconds = time.perf_counter() - start
+        metrics.set("articles_per_second", totals["scraped"] / seconds if seconds else 0)
+    return totals
+
+
+# This function turns the optional first and last day of the statistics into a range that works in sql, the days are in the yyyy-mm-dd format
+def date_range(start, end):
+    return start or "0000-00-00", end or "9999-99-99"
+
+
+# This function returns the sqlite expression that turns the day column into the key of its period and the parameters of the expression
+def period_expression(column, period):
+    modifiers = PERIOD_MODIFIERS[period]
+    return f"strftime(?, {column}{', ?' * len(modifiers)})", [PERIOD_FORMATS[period]] + modifiers
 
-# This function counts the occurrence of a specific search term over days or months
+
+# This function returns the key of the period that a yyyy-mm-dd day is in, it is the same key that period_expression gives in sqlite
+def period_key(day, period):
+    day = date.fromisoformat(day)
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+    return day.strftime(PERIOD_FORMATS[period])
+
+
+# This function counts the occurrence of a specific search term per day, week, month or year, optionally only between the start and end days
+# Every period that has articles gets a value even if the term isn't in them
 @connector
-def count_word_occurrence(cursor, search_word, month=False):
-    articles = []
+def count_word_occurrence(cursor, search_word, period="day", start=None, end=None):
+    period_key_sql, period_parameters = period_expression("days.day", period)
+    start, end = date_range(start, end)
+    # When the search word is a search term whose counts are in the index, the daily counts can be added up in the database instead
+    cursor.execute("select id from search_terms where term = ?", (search_word,))
+    row = cursor.fetchone()
+    if row is not None and term_index_ready([row[0]]):
+        return dict(cursor.execute(f"select {period_key_sql}, coalesce(sum(terms.count), 0) from daily_article_counts days "
+                                   "left join daily_term_counts terms on terms.day = days.day and terms.term_id = ? "
+                                   "where days.day between ? and ? and days.count > 0 group by 1 order by 1",
+                                   period_parameters + [row[0], start, end]))
+
     # This dictionary stores dates in the keys and the occurrence of the search word on that date in the value
     word_count = {}
-    if month == False:
-        for row in cursor.execute("select text, date from scraped_articles"):
-            articles.append((row[0], row[1]))
-            # Here I assign the keys to the dictionary and set their starting value to 0
-            word_count[row[1]] = 0
-    else:
-        for row in cursor.execute("select text, date from scraped_articles"):
-            # Here I use the calendar.month_name function to get the name of the month
-            articles.append((row[0], calendar.month_name[int(row[1].split("-")[1])]))
-            word_count[calendar.month_name[int(row[1].split("-")[1])]] = 0
-
-    for art in articles:
-        previous_word = ""
-        words = separate_words(art[0])
-        for word in words:
-            if word == search_word or previous_word + " " + word == search_word:
-                word_count[art[1]] += 1
-            previous_word = word
+    # The texts are read a few at a time and counted right away, so the articles never have to be in memory all at once
+    cursor.execute("select article_texts.text, scraped_articles.date from scraped_articles "
+                   "join article_texts on article_texts.article_id = scraped_articles.id "
+                   "where scraped_articles.date between ? and ? order by scraped_articles.date", (start, end))
+    for text, day in iter_rows(cursor):
+        key = period_key(day, period)
+        # Here I assign the keys to the dictionary and set their starting value to 0
+        word_count.setdefault(key, 0)
+        for word, bigram in iter_bigrams(decompress_text(text)):
+            if word == search_word or bigram == search_word:
+                word_count[key] += 1
     return word_count
 
 
-# This function fetches the amount of articles of a certain category per day from the database
+# This function fetches the amount of articles of a certain category per day, week, month or year from the daily counts, optionally only between the start and end days
 @connector
-def count_category_occurrence(cursor, category_id):
+def count_category_occurrence(cursor, category_id, period="day", start=None, end=None):
+    start, end = date_range(start, end)
+    period_key_sql, period_parameters = period_expression("days.day", period)
     # This dictionary stores the dates as keys and amount of articles as values
     categories = {}
-    for row in cursor.execute(f"select count(*), date from scraped_articles group by date, category_id having category_id = '{category_id}'"):
+    for row in cursor.execute(f"select {period_key_sql}, coalesce(sum(categories.count), 0) from daily_article_counts days "
+                              "left join daily_category_counts categories on categories.day = days.day and categories.category_id = ? "
+                              "where days.day between ? and ? and days.count > 0 group by 1 order by 1",
+                              period_parameters + [category_id, start, end]):
         # Here I assign the value as the amount of articles
-        categories[row[1]] = row[0]
+        categories[row[0]] = row[1]
     return categories
 
 
-# This function counts the total occurrence of each category
+# This function works out the first and last day of a trend, when they aren't given they are the first and last day that has articles
+def trend_days(cursor, start, end):
+    first, last = date_range(start, end)
+    cursor.execute("select min(day), max(day) from daily_article_counts where day between ? and ? and count > 0", (first, last))
+    first_day, last_day = cursor.fetchone()
+    return start or first_day, end or last_day
+
+
+# This function loads the daily counts of many search terms at once into trends, the terms don't have to be search terms
+# The counts come from the term index when every term is in it, otherwise all of the terms are counted in a single pass over the article texts
+@connector
+def load_term_trends(cursor, terms, start=None, end=None):
+    start, end = trend_days(cursor, start, end)
+    # A term that is asked for twice gets one series, otherwise the counts of both series would go into the same row
+    terms = list(dict.fromkeys(terms))
+    volume_rows = cursor.execute("select day, count from daily_article_counts where day between ? and ?", (start, end)).fetchall()
+    placeholders = ",".join("?" * len(terms))
+    term_ids = dict(cursor.execute(f"select term, id from search_terms where term in ({placeholders})", terms).fetchall())
+    if len(term_ids) == len(terms) and term_index_ready(term_ids.values()):
+        series_of_id = {term_ids[term]: index for index, term in enumerate(terms)}
+        rows = [(series_of_id[term_id], day, count) for term_id, day, count in
+                cursor.execute(f"select term_id, day, count from daily_term_counts where term_id in ({placeholders}) and day between ? and ?",
+                               list(series_of_id) + [start, end])]
+        return Trends.from_rows(terms, rows, volume_rows, start, end)
+
+    # The term ids of these search terms are the index of their series
+    matcher = TermMatcher([SearchTerm(term, None, index) for index, term in enumerate(terms)])
+    rows = []
+    cursor.execute("select article_texts.text, scraped_articles.date from scraped_articles "
+                   "join article_texts on article_texts.article_id = scraped_articles.id "
+                   "where scraped_articles.date between ? and ?", (start, end))
+    for text, day in iter_rows(cursor):
+        for search_term, count in matcher.count_terms(iter_words(decompress_text(text))).items():
+            rows.append((search_term.term_id, day, count))
+    return Trends.from_rows(terms, rows, volume_rows, start, end)
+
+
+# This function loads the daily amount of articles of many categories at once into trends, the series are named after the categories
+@connector
+def load_category_trends(cursor, category_ids, start=None, end=None):
+    start, end = trend_days(cursor, start, end)
+    category_ids = list(dict.fromkeys(category_ids))
+    names = dict(cursor.execute("select id, category from categories"))
+    volume_rows = cursor.execute("select day, count from daily_article_counts where day between ? and ?", (start, end)).fetchall()
+    series_of_id = {category_id: index for index, category_id in enumerate(category_ids)}
+    rows = [(series_of_id[category_id], day, count) for category_id, day, count in
+            cursor.execute(f"select category_id, day, count from daily_category_counts where category_id in ({','.join('?' * len(category_ids))}) "
+                           "and day between ? and ?", category_ids + [start, end])]
+    return Trends.from_rows([names.get(category_id, str(category_id)) for category_id in category_ids], rows, volume_rows, start, end)
+
+
+# This function loads how many articles each phrase is in per day into trends, the phrases are looked up in the full text index so any amount of words works
+@connector
+def load_phrase_trends(cursor, phrases, start=None, end=None, raw=False):
+    start, end = trend_days(cursor, start, end)
+    phrases = list(phrases)
+    volume_rows = cursor.execute("select day, count from daily_article_counts where day between ? and ?", (start, end)).fetchall()
+    rows = []
+    for index, phrase in enumerate(phrases):
+        for day, count in cursor.execute("select scraped_articles.date, count(*) from article_search "
+                                         "join scraped_articles on scraped_articles.id = article_search.rowid "
+                                         "where article_search match ? and scraped_articles.date between ? and ? group by scraped_articles.date",
+                                         (phrase if raw else phrase_query(phrase), start, end)):
+            rows.append((index, day, count))
+    return Trends.from_rows(phrases, rows, volume_rows, start, end)
+
+
+# This function counts the total occurrence of each category from the category that is stored with every article
 @connector
 def count_total_category_occurrence(cursor):
-    search_terms = []
-    for row in cursor.execute("select category_id, term from search_terms"):
-        search_terms.append(SearchTerm(row[1].lower(), row[0]))
-
     # This dictionary stores the categories in the keys and their occurrence in the values
     total_category_count = {}
-    # Here I fetch the actual category names because I need them for writing the graph
-    for term in search_terms:
-        cursor.execute(f"select category from categories where id = {term.category}")
-        term.category = cursor.fetchone()[0]
+    for row in cursor.execute("select category from categories order by id"):
         # Here I assign the starting value at each key to 0
-        total_category_count[term.category] = 0
-
-    articles = []
-    for row in cursor.execute("select text from scraped_articles"):
-        articles.append(row[0])
-
-    for article in articles:
-        category_counter = {}
-        words = separate_words(article)
-        previous_word = ""
-        for word in words:
-            for search_term in search_terms:
-                if word == search_term.term or previous_word + " " + word == search_term.term:
-                    try:
-                        category_counter[search_term.category] += 1
-                    except KeyError:
-                        category_counter[search_term.category] = 1
-            previous_word = word
-        sorted_categories = sorted(category_counter.items(), key=lambda x: x[1], reverse=True)
-        try:
-            total_category_count[sorted_categories[0][0]] += 1
-        # Here I set the category to "None" in case none of my search terms are in the article
-        except IndexError:
-            try:
-                total_category_count["None"] += 1
-            except KeyError:
-                total_category_count["None"] = 1
+        total_category_count[row[0]] = 0
+    for category, count in cursor.execute("select categories.category, count(*) from scraped_articles "
+                                          "left join categories on categories.id = scraped_articles.category_id "
+                                          "group by scraped_articles.category_id"):
+        # Here I set the category to "None" for the articles that don't have any of my search terms in them
+        total_category_count[category or "None"] = count
     return total_category_count
 
 
-# This function plots the occurrence of one search term or two search terms or a category over days or months
-def plot_word_occurrence(word_count, search_word, word_count_2=None, search_word_2=None):
-    plt.plot(word_count.keys(), word_count.values(), 'o-', label=search_word)
-    if word_count_2 == None and search_word_2 == None:
-        plt.title(f"Occurence of {search_word} in news articles")
-    else:
-        plt.plot(word_count_2.keys(), word_count_2.values(),'o-', label=search_word_2)
-        plt.title(f"Occurence of {search_word} and {search_word_2} in news articles")
-    plt.legend(loc="best")
-    plt.xlabel("Date")
-    plt.ylabel("Occurrence")
-    print("You have to close the graph window to continue using the program")
-    plt.show()
+# This function saves a graph of every series of the trends over real dates, so the days without articles show up as gaps on the axis instead of disappearing
+def plot_trends(trends, title, ylabel="Occurrence"):
+    path = render_trends(trends, title, plot_path(title), ylabel)
+    print(f"The graph was saved to {path}")
 
 
-# This function makes a bar graph showing the amount of articles of each category
+# This function saves a bar graph showing the amount of articles of each category
 def bar_category_occurrence(category_count):
-    plt.bar(category_count.keys(), category_count.values())
-    plt.title("Occurrence of categories")
-    plt.xlabel("Category")
-    plt.ylabel("Occurrence")
-    print("You have to close the graph window to continue using the program")
-    plt.show()
+    path = render_bars(category_count, "Occurrence of categories", plot_path("Occurrence of categories"))
+    print(f"The graph was saved to {path}")
 
 
 # This function shows all categories, it can show indexes if I want the user to select a category and it can return a dictionary with category names if I want them
@@ -326,7 +1151,7 @@ def see_categories(cursor, just_print=False, return_dict=False):
 @connector
 def see_search_terms(cursor, category_id):
     dict_of_terms = {}
-    for index, row in enumerate(cursor.execute(f"select term from search_terms where category_id = {category_id}"), 1):
+    for index, row in enumerate(cursor.execute("select term from search_terms where category_id = ?", (category_id,)), 1):
         dict_of_terms[index] = row[0]
         print(f"[{index}]", dict_of_terms[index].title())
     return dict_of_terms
@@ -339,23 +1164,376 @@ def see_domains(cursor):
         print(row[0])
 
 
-# This function saves all urls from scraped articles to a .txt file
+# This function saves all urls from scraped articles to a .txt file, they are written while they are read so the list of urls never has to be in memory
 @connector
-def save_urls_to_file(cursor):
-    urls = []
-    for row in cursor.execute("select url from scraped_articles"):
-        urls.append(row[0])
-    with open("news urls.txt", "w") as file:
-        for url in urls:
-            file.write(url + "\n")
-    print(f'I\'ve saved {len(urls)} urls to a file named "news urls".')
+def save_urls_to_file(cursor, path="news urls.txt"):
+    amount = 0
+    cursor.execute("select url from scraped_articles")
+    with open(path, "w") as file:
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            file.writelines(row[0] + "\n" for row in rows)
+            amount += len(rows)
+    print(f'I\'ve saved {amount} urls to a file named "{os.path.splitext(path)[0]}".')
+
+
+# This function turns what the user typed into an fts5 query that looks for all of its words next to each other, in the same order
+def phrase_query(phrase):
+    return '"' + phrase.replace('"', '""') + '"'
+
+
+# This function finds the articles that match the query in the full text index, the best matches by bm25 come first
+# The query is a phrase unless raw is True, then the whole fts5 query syntax can be used, like missile AND NEAR(armed forces) or infla*
+@connector
+def search_articles(cursor, query, start=None, end=None, limit=20, raw=False):
+    start, end = date_range(start, end)
+    return cursor.execute("select scraped_articles.id, scraped_articles.url, scraped_articles.date, domains.domain, bm25(article_search) "
+                          "from article_search join scraped_articles on scraped_articles.id = article_search.rowid "
+                          "left join domains on domains.id = scraped_articles.domain_id "
+                          "where article_search match ? and scraped_articles.date between ? and ? "
+                          "order by bm25(article_search) limit ?",
+                          (query if raw else phrase_query(query), start, end, limit)).fetchall()
+
+
+# This function fetches the text of one article
+@connector
+def load_article_text(cursor, article_id):
+    cursor.execute("select text from article_texts where article_id = ?", (article_id,))
+    row = cursor.fetchone()
+    return None if row is None else decompress_text(row[0])
+
+
+# This function returns the part of the text around the first place where the words are, the index doesn't keep the texts so they are read from article_texts
+def search_snippet(article_id, words, width=80):
+    text = load_article_text(article_id) or ""
+    position = max(text.lower().find(words.lower()), 0)
+    start = max(position - width, 0)
+    end = position + len(words) + width
+    return ("..." if start else "") + " ".join(text[start:end].split()) + ("..." if end < len(text) else "")
+
+
+# This error means that another process holds the scrape lock, a scrape that stops with it didn't fail and only has to wait for the other one
+class ScrapeLockedError(RuntimeError):
+    pass
+
+
+# This function holds the scrape lock while a scrape runs, a lock that was left behind by a process that doesn't exist anymore is taken over
+@contextmanager
+def scrape_lock(path=LOCK_FILE):
+    while True:
+        try:
+            descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                with open(path) as file:
+                    pid = int(file.read() or 0)
+                # A lock file without a pid was left half written, unless it was made a moment ago and its process is still writing the pid
+                # os.kill(0, 0) would signal this process group and always succeed, so such a lock would never be taken over
+                if pid <= 0:
+                    if time.time() - os.path.getmtime(path) < LOCK_WRITE_SECONDS:
+                        time.sleep(0.05)
+                        continue
+                    raise ProcessLookupError
+                os.kill(pid, 0)
+            except (ValueError, ProcessLookupError):
+                os.remove(path)
+                continue
+            except (FileNotFoundError, PermissionError):
+                continue
+            raise ScrapeLockedError(f"Another scrape is already running (process {pid})")
+    with os.fdopen(descriptor, "w") as file:
+        file.write(str(os.getpid()))
+    try:
+        yield
+    finally:
+        os.remove(path)
+
+
+# This function runs one scrape round with the lock held and returns a summary of it
+# When profile is a file name the round is profiled into that file
+def timed_scrape_round(workers=PARSE_WORKERS, profile=None):
+    http_cache.reset_stats()
+    start = time.perf_counter()
+    with scrape_lock():
+        totals = profile_round(profile, workers) if profile else scrape_round(workers)
+        # Search terms that were added since the last round are counted in the stored articles before the round ends
+        with metrics.timer("term_index"):
+            update_term_index()
+    totals["seconds"] = round(time.perf_counter() - start, 3)
+    totals["cache"] = dict(http_cache.stats)
+    metrics.count("rounds")
+    metrics.set("round_seconds", totals["seconds"])
+    return totals
+
+
+# This function runs scrape rounds forever, or for a number of rounds, with a random jitter added to the interval so that the news sites aren't hit at the same second every time
+# When metrics_file is given the metrics are saved to it as json after every round
+def run_scheduler(interval, jitter=0, rounds=None, workers=PARSE_WORKERS, metrics_file=None):
+    logger = logging.getLogger("scheduler")
+    completed = 0
+    # The rounds start at a fixed rate, the time a round takes is not added to the interval
+    next_start = time.monotonic()
+    while rounds is None or completed < rounds:
+        try:
+            totals = timed_scrape_round(workers)
+            logger.info("Scrape round finished in %.1fs: %d scraped, %d duplicates, %d failed, %s", totals["seconds"], totals["scraped"], totals["duplicates"], totals["failed"], http_cache.report())
+        except ScrapeLockedError as error:
+            logger.warning("Skipping this round: %s", error)
+        except Exception:
+            metrics.count("round_errors")
+            logger.exception("Scrape round failed")
+        if metrics_file:
+            metrics.write_json(metrics_file)
+        completed += 1
+        if rounds is not None and completed >= rounds:
+            break
+        # A round that took longer than the interval starts the next one right away, the missed rounds aren't made up
+        next_start = max(next_start + interval, time.monotonic())
+        time.sleep(max(0, next_start + random.uniform(-jitter, jitter) - time.monotonic()))
+
+
+# This function describes where the time of the last scrape went, the stages are summed over every article so they can add up to more than the whole scrape
+def metrics_summary():
+    snapshot = metrics.snapshot()
+    stages = {}
+    for timing in snapshot["timings"]:
+        stages[timing["name"]] = stages.get(timing["name"], 0) + timing["seconds"]
+    gauges = {gauge["name"]: gauge["value"] for gauge in snapshot["gauges"] if not gauge["labels"]}
+    summary = ", ".join(f"{name} {stages[name]:.1f}s" for name in ("fetch", "parse", "match", "write") if name in stages)
+    return f"{gauges.get('articles_per_second', 0):.1f} articles per second ({summary})"
+
+
+# This function prints a dictionary of statistics as json or as csv with the key and value columns
+def write_counts(counts, output_format, key_name):
+    if output_format == "json":
+        json.dump(counts, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow([key_name, "count"])
+        writer.writerows(counts.items())
+
+
+# This function prints trends as json with one object per series, or as csv with one column per series
+def write_trends(trends, output_format, key_name):
+    series = trends.to_dict(PERIOD_FORMATS[trends.period])
+    if output_format == "json":
+        json.dump(series, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow([key_name] + trends.labels)
+        for index, day in enumerate(trends.days.astype(object)):
+            writer.writerow([day.strftime(PERIOD_FORMATS[trends.period])] + trends.values[:, index].tolist())
+
+
+# This function loads the trends of the search terms and categories that were asked for on the command line
+def trends_of_arguments(arguments):
+    trends = load_term_trends([term.lower() for term in arguments.terms], arguments.start, arguments.end)
+    if arguments.category:
+        trends = trends.combine(load_category_trends(arguments.category, arguments.start, arguments.end))
+    if arguments.phrase:
+        trends = trends.combine(load_phrase_trends(arguments.phrase, arguments.start, arguments.end))
+    trends = trends.resample(arguments.period)
+    if arguments.normalize:
+        trends = trends.normalized()
+    return trends.rolling(arguments.rolling)
+
+
+# This function saves the graphs of the trends in every format and returns their paths, either one graph with every series or one graph per series
+def save_plots(trends, directory, plot_formats, separate=False, totals=False, ylabel="Occurrence"):
+    if separate:
+        graphs = [(trends.subset([label]), f"Occurrence of {label.title()} in news articles") for label in trends.labels]
+    else:
+        graphs = [(trends, f"Occurrence of {', '.join(label.title() for label in trends.labels)} in news articles")] if trends.labels else []
+    paths = []
+    for plot_format in plot_formats:
+        for graph, title in graphs:
+            paths.append(render_trends(graph, title, plot_path(title, directory, plot_format), ylabel))
+        if totals:
+            paths.append(render_bars(count_total_category_occurrence(), "Occurrence of categories",
+                                     plot_path("Occurrence of categories", directory, plot_format)))
+    return paths
+
+
+# This function prints the search results as json or csv, with the part of every article where the words are
+def write_search_results(results, query, output_format):
+    columns = ["id", "url", "date", "domain", "score", "snippet"]
+    rows = [list(row[:4]) + [round(-row[4], 3), search_snippet(row[0], query)] for row in results]
+    if output_format == "json":
+        json.dump([dict(zip(columns, row)) for row in rows], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+# This function describes the commands that can be run without the menu
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Online Media Sentiment Tracker, run without a command to get the menu")
+    commands = parser.add_subparsers(dest="command")
+
+    scrape = commands.add_parser("scrape", help="Scrape every domain once and print a json summary")
+    scrape.add_argument("--workers", type=int, default=PARSE_WORKERS, help="Processes used to parse the articles, 0 parses them in this process")
+    scrape.add_argument("--metrics", help="Save the timings and counters of the round to this json file")
+    scrape.add_argument("--profile", help="Profile the round with cProfile into this file, the memory use is saved next to it")
+
+    count_term = commands.add_parser("count-term", help="Count the occurrences of a search term")
+    count_term.add_argument("term")
+
+    category_stats = commands.add_parser("category-stats", help="Count the articles of every category, or of one category over time")
+    category_stats.add_argument("--category", type=int, help="The id of the category to count over time")
+
+    trends = commands.add_parser("trends", help="Count many search terms or categories over time at once, including the periods without articles")
+    trends.add_argument("terms", nargs="*", help="The search terms to count")
+
+    search = commands.add_parser("search", help="Find the articles that have a phrase in them, the best matches first")
+    search.add_argument("query")
+    search.add_argument("--raw", action="store_true", help="Use the query as fts5 query syntax instead of as one phrase")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--start", help="The first day to search, as yyyy-mm-dd")
+    search.add_argument("--end", help="The last day to search, as yyyy-mm-dd")
+    search.add_argument("--format", choices=["json", "csv"], default="json")
+
+    plot = commands.add_parser("plot", help="Save graphs of search terms or categories over time without opening a window")
+    plot.add_argument("terms", nargs="*", help="The search terms to plot")
+    plot.add_argument("--separate", action="store_true", help="Save one graph per search term or category instead of one graph with all of them")
+    plot.add_argument("--totals", action="store_true", help="Also save a bar graph of the articles of every category")
+    plot.add_argument("--output-dir", default=PLOT_DIRECTORY, help="The directory that the graphs are saved in")
+
+    for command in (trends, plot):
+        command.add_argument("--category", type=int, action="append", default=[], help="The id of a category to count, can be given more than once")
+        command.add_argument("--phrase", action="append", default=[], help="Count the articles that have this phrase in them, it can have any amount of words and can be given more than once")
+        command.add_argument("--rolling", type=int, default=1, help="Average every value with this many periods before it")
+        command.add_argument("--normalize", action="store_true", help="Divide the counts by the amount of articles in the period")
+
+    for command in (count_term, category_stats, trends, plot):
+        command.add_argument("--period", choices=PERIOD_FORMATS, default="day")
+        command.add_argument("--start", help="The first day to count, as yyyy-mm-dd")
+        command.add_argument("--end", help="The last day to count, as yyyy-mm-dd")
+    for command in (count_term, category_stats, trends):
+        command.add_argument("--format", choices=["json", "csv"], default="json")
+    plot.add_argument("--format", choices=PLOT_FORMATS, action="append", help="The image format, can be given more than once, png is used by default")
+
+    export = commands.add_parser("export", help="Write the scraped articles to a file, or to a directory of files that are written at the same time")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="The compressed formats and parquet need --output-dir")
+    export.add_argument("--output", help="The file to write to, the articles are printed if it is left out")
+    export.add_argument("--output-dir", help="Write the articles to this directory with one file per chunk")
+    export.add_argument("--start", help="The first day to export, as yyyy-mm-dd")
+    export.add_argument("--end", help="The last day to export, as yyyy-mm-dd")
+    export.add_argument("--domain", action="append", default=[], help="Only export the articles of this domain, can be given more than once")
+    export.add_argument("--text", action="store_true", help="Also export the text of every article")
+    export.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="The most articles in one file")
+    export.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="Threads that write files at the same time")
+
+    schedule = commands.add_parser("schedule", help="Keep scraping at a fixed interval")
+    schedule.add_argument("--interval", type=float, default=3600, help="Seconds between the start of two rounds")
+    schedule.add_argument("--jitter", type=float, default=300, help="The most seconds that a round can start early or late")
+    schedule.add_argument("--rounds", type=int, help="Stop after this many rounds")
+    schedule.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    schedule.add_argument("--metrics", help="Save the timings and counters to this json file after every round")
+    schedule.add_argument("--metrics-port", type=int, help="Serve the metrics for prometheus on this port at /metrics")
+
+    commands.add_parser("menu", help="Start the interactive menu")
+    return parser.parse_args(arguments)
+
+
+# This function runs a command from the command line and returns the exit code
+def run_command(arguments):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s", stream=sys.stderr)
+    setup_database()
+    if arguments.command == "scrape":
+        try:
+            totals = timed_scrape_round(arguments.workers, arguments.profile)
+        except ScrapeLockedError as error:
+            logging.error(error)
+            return 1
+        if arguments.metrics:
+            metrics.write_json(arguments.metrics)
+        json.dump(totals, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif arguments.command == "count-term":
+        write_counts(count_word_occurrence(arguments.term.lower(), arguments.period, arguments.start, arguments.end), arguments.format, arguments.period)
+    elif arguments.command == "category-stats":
+        if arguments.category is None:
+            write_counts(count_total_category_occurrence(), arguments.format, "category")
+        else:
+            write_counts(count_category_occurrence(arguments.category, arguments.period, arguments.start, arguments.end), arguments.format, arguments.period)
+    elif arguments.command == "trends":
+        write_trends(trends_of_arguments(arguments), arguments.format, arguments.period)
+    elif arguments.command == "search":
+        try:
+            results = search_articles(arguments.query, arguments.start, arguments.end, arguments.limit, arguments.raw)
+        except sqlite3.OperationalError as error:
+            logging.error("That search doesn't work: %s", error)
+            return 1
+        write_search_results(results, arguments.query, arguments.format)
+    elif arguments.command == "plot":
+        ylabel = "Occurrence per article" if arguments.normalize else "Occurrence"
+        for path in save_plots(trends_of_arguments(arguments), arguments.output_dir, arguments.format or ["png"], arguments.separate, arguments.totals, ylabel):
+            print(path)
+    elif arguments.command == "export":
+        export_filter = ExportFilter(arguments.start, arguments.end, arguments.domain, arguments.text)
+        if arguments.output_dir:
+            try:
+                totals = export_archive(arguments.output_dir, arguments.format, export_filter, arguments.chunk_size, arguments.workers)
+            except RuntimeError as error:
+                logging.error(error)
+                return 1
+            json.dump(totals, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        elif arguments.format not in ("csv", "jsonl"):
+            logging.error("The %s format can only be written with --output-dir", arguments.format)
+            return 1
+        elif arguments.output:
+            with open(arguments.output, "w", newline="", encoding="utf-8") as file:
+                export_articles(file, arguments.format, export_filter)
+        else:
+            export_articles(sys.stdout, arguments.format, export_filter)
+    elif arguments.command == "schedule":
+        if arguments.metrics_port:
+            serve_metrics(arguments.metrics_port)
+        run_scheduler(arguments.interval, arguments.jitter, arguments.rounds, arguments.workers, arguments.metrics)
+    database.close()
+    return 0
 
 
 class Menu:
 
     def __init__(self):
+        setup_database()
+        # This continues counting search terms that haven't been counted in every stored article yet
+        start_backfill()
         self.start_main_menu()
 
+    # This function asks for a category and then for one of its search terms and returns the search term, or None if the answer wasn't valid
+    def choose_search_term(self, category_question, term_question):
+        print(category_question)
+        category_id_list = see_categories()
+        try:
+            category_for_search_term_index = int(input())
+        except ValueError:
+            print("That is not a number")
+            return None
+        if category_for_search_term_index not in category_id_list:
+            print("That is not a valid number")
+            return None
+        print(term_question)
+        search_terms_dict = see_search_terms(category_for_search_term_index)
+        try:
+            search_term_index = int(input())
+        except ValueError:
+            print("That is not a number")
+            return None
+        if search_term_index not in search_terms_dict:
+            print("That is not a valid number")
+            return None
+        return search_terms_dict[search_term_index]
+
     # This function is the menu
     def start_main_menu(self):
         print("Welcome to the Online Media Sentiment Tracker!")
@@ -365,7 +1543,7 @@ class Menu:
             print("What would you like to do? \n"
                   "[1] See a list of the categories \n"
                   "[2] See a plot of the occurrences of a search term \n"
-                  "[3] See a plot comparing the occurrences of two different search terms \n"
+                  "[3] See a plot comparing the occurrences of several search terms \n"
                   "[4] See the monthly statistics of a search term \n"
                   "[5] See a plot of the occurrences of articles of a category \n"
                   "[6] See a bar graph of total occurrences of every category \n"
@@ -374,25 +1552,30 @@ class Menu:
                   "[9] Add a search term \n"
                   "[0] Add a category  \n"
                   "[10] Add a domain \n"
+                  "[11] Remove a search term \n"
+                  "[12] Search the articles for a phrase \n"
                   "[s] Scrape articles from the web \n"
                   "[q] Quit")
-            available_options = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "0", "10", "q", "s"]
+            available_options = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "0", "10", "11", "12", "q", "s"]
             user_input = input().lower()
             if user_input not in available_options:
                 print("That is not an option, try again")
                 continue
             if user_input == "q":
+                database.close()
                 break
             if user_input == "s":
+                metrics.reset()
                 print("Scraping in progress...")
-                scrape_ap()
-                print("Scraping in progress...")
-                scrape_articles()
-                print("Scraping in progress...")
-                scrape_reuters()
-                print("Scraping in progress...")
-                scrape_articles()
-                print("Scraping finished")
+                try:
+                    totals = timed_scrape_round()
+                except ScrapeLockedError as error:
+                    print(error)
+                    input("Press Enter to continue")
+                    continue
+                print(f"Scraping finished, {totals['scraped']} articles were scraped, {totals['duplicates']} were copies of stored articles and {totals['failed']} failed")
+                print(http_cache.report())
+                print(metrics_summary())
                 input("Press Enter to continue")
             if user_input == "1":
                 see_categories(True)
@@ -421,57 +1604,32 @@ class Menu:
                         print("That is not a valid number")
                         continue
                     else:
-                        plot_word_occurrence(count_word_occurrence(search_terms_dict[search_term_index]), search_terms_dict[search_term_index].title())
+                        plot_trends(load_term_trends([search_terms_dict[search_term_index]]),
+                                    f"Occurrence of {search_terms_dict[search_term_index].title()} in news articles")
                         input("Press Enter to continue")
             if user_input == "3":
-                print("What category is the first search term in?")
-                category_id_list = see_categories()
+                print("How many search terms would you like to compare?")
                 try:
-                    category_for_search_term_index = int(input())
+                    amount_of_terms = int(input())
                 except ValueError:
                     print("That is not a number")
                     continue
-                if category_for_search_term_index not in category_id_list:
-                    print("That is not a valid number")
+                if amount_of_terms < 2:
+                    print("You need at least two search terms to compare them")
                     continue
-                else:
-                    print("What is the first search term you would like to see the occurrences of?")
-                    search_terms_dict_1 = see_search_terms(category_for_search_term_index)
-                    try:
-                        search_term_index_1 = int(input())
-                    except ValueError:
-                        print("That is not a number")
-                        continue
-                    if search_term_index_1 not in search_terms_dict_1:
-                        print("That is not a valid number")
-                        continue
-                    else:
-                        print("What category is the second search term in?")
-                        category_id_list = see_categories()
-                        try:
-                            category_for_search_term_index = int(input())
-                        except ValueError:
-                            print("That is not a number")
-                            continue
-                        if category_for_search_term_index not in category_id_list:
-                            print("That is not a valid number")
-                            continue
-                        else:
-                            print("And what is the second search term you would like to see the occurrences of?")
-                            search_terms_dict_2 = see_search_terms(category_for_search_term_index)
-                            try:
-                                search_term_index_2 = int(input())
-                            except ValueError:
-                                print("That is not a number")
-                                continue
-                            if search_term_index_2 not in search_terms_dict_2:
-                                print("That is not a valid number")
-                                continue
-                            else:
-                                plot_word_occurrence(count_word_occurrence(search_terms_dict_1[search_term_index_1]),
-                                search_terms_dict_1[search_term_index_1].title(), count_word_occurrence(search_terms_dict_2[search_term_index_2]),
-                                search_terms_dict_2[search_term_index_2].title())
-                                input("Press Enter to continue")
+                terms_to_compare = []
+                for number in range(1, amount_of_terms + 1):
+                    search_term = self.choose_search_term(f"What category is search term {number} in?",
+                                                          f"What is search term {number} you would like to see the occurrences of?")
+                    if search_term is None:
+                        break
+                    terms_to_compare.append(search_term)
+                if len(terms_to_compare) < amount_of_terms:
+                    continue
+                # Every search term is counted in the same pass, so comparing more of them doesn't take longer
+                plot_trends(load_term_trends(terms_to_compare),
+                            f"Occurrence of {', '.join(term.title() for term in terms_to_compare)} in news articles")
+                input("Press Enter to continue")
             if user_input == "4":
                 print("What category is the search term in?")
                 category_id_list = see_categories()
@@ -495,8 +1653,8 @@ class Menu:
                         print("That is not a valid number")
                         continue
                     else:
-                        plot_word_occurrence(count_word_occurrence(search_terms_dict_monthly[search_term_index_monthly], True),
-                        search_terms_dict_monthly[search_term_index_monthly].title())
+                        plot_trends(load_term_trends([search_terms_dict_monthly[search_term_index_monthly]]).resample("month"),
+                                    f"Monthly occurrence of {search_terms_dict_monthly[search_term_index_monthly].title()} in news articles")
                         input("Press Enter to continue")
             if user_input == "5":
                 category_dict = see_categories(False, True)
@@ -510,10 +1668,9 @@ class Menu:
                     print("That is not a valid number")
                     continue
                 else:
-                    plot_word_occurrence(count_category_occurrence(category_id), category_dict[category_id].title())
+                    plot_trends(load_category_trends([category_id]), f"Occurrence of {category_dict[category_id].title()} articles")
                     input("Press Enter to continue")
             if user_input == "6":
-                print("It will take a few seconds to categorize every article")
                 bar_category_occurrence(count_total_category_occurrence())
                 input("Press Enter to continue")
             if user_input == "7":
@@ -544,7 +1701,9 @@ class Menu:
                         print("A search term can't be longer than two words")
                         continue
                     else:
-                        add_term(search_term_to_add, category_id_for_search_term)
+                        if add_term(search_term_to_add, category_id_for_search_term):
+                            print("The search term will be counted in the stored articles in the background")
+                            start_backfill()
                         input("Press Enter to continue")
             if user_input == "0":
                 print("What category would you like to add?")
@@ -568,6 +1727,54 @@ class Menu:
                     else:
                         add_domain(domain_to_add)
                         input("Press Enter to continue")
+            if user_input == "11":
+                print("What category is the search term in?")
+                category_id_list = see_categories()
+                try:
+                    category_for_search_term_index = int(input())
+                except ValueError:
+                    print("That is not a number")
+                    continue
+                if category_for_search_term_index not in category_id_list:
+                    print("That is not a valid number")
+                    continue
+                else:
+                    print("What search term would you like to remove?")
+                    search_terms_dict_remove = see_search_terms(category_for_search_term_index)
+                    try:
+                        search_term_index_remove = int(input())
+                    except ValueError:
+                        print("That is not a number")
+                        continue
+                    if search_term_index_remove not in search_terms_dict_remove:
+                        print("That is not a valid number")
+                        continue
+                    else:
+                        if remove_term(search_terms_dict_remove[search_term_index_remove]):
+                            print("The articles that had that search term will be recategorized in the background")
+                            start_backfill()
+                        input("Press Enter to continue")
+            if user_input == "12":
+                print("What words would you like to search for? They are searched as one phrase and can be as long as you want")
+                phrase = input().lower().strip()
+                if phrase == "":
+                    print("You can't search for nothing")
+                    continue
+                results = search_articles(phrase, limit=10)
+                if not results:
+                    print("No articles have that phrase in them")
+                    input("Press Enter to continue")
+                    continue
+                for article_id, url, day, domain, score in results:
+                    print(day, url)
+                    print("   ", search_snippet(article_id, phrase))
+                monthly = load_phrase_trends([phrase]).resample("month").to_dict(PERIOD_FORMATS["month"])[phrase]
+                print("Articles with the phrase per month:", ", ".join(f"{month}: {count:.0f}" for month, count in monthly.items()))
+                input("Press Enter to continue")
 
 if __name__ == "__main__":
-    menu = Menu()
+    arguments = parse_arguments()
+    if arguments.command in (None, "menu"):
+        menu = Menu()
+    else:
+        sys.exit(run_command(arguments))
\ No newline at end of file
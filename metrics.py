@@ -0,0 +1,110 @@
+import http.server
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+# The metrics keep counters and timings for every stage of a scrape, each one can have labels such as the domain it belongs to
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timings = {}
+            self.gauges = {}
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def count(self, name, amount=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    # A timing keeps how many times something happened, how long it took in total and the longest time
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            count, total, longest = self.timings.get(key, (0, 0.0, 0.0))
+            self.timings[key] = (count + 1, total + seconds, max(longest, seconds))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # This function returns every metric as a dictionary that can be saved as json
+    def snapshot(self):
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.gauges.items()],
+                "timings": [{"name": name, "labels": dict(labels), "count": count, "seconds": total, "max_seconds": longest}
+                            for (name, labels), (count, total, longest) in self.timings.items()],
+            }
+
+    def write_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    # This function returns the metrics in the text format that prometheus reads, the timings become _count, _seconds_total and _seconds_max series
+    def prometheus_text(self):
+        def series(name, labels, value):
+            label_text = ",".join(f'{key}="{escape_label(label)}"' for key, label in labels)
+            return f"news_{name}{{{label_text}}} {value}" if label_text else f"news_{name} {value}"
+
+        lines = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(series(name + "_total", labels, value))
+            for (name, labels), value in sorted(self.gauges.items()):
+                lines.append(series(name, labels, value))
+            for (name, labels), (count, total, longest) in sorted(self.timings.items()):
+                lines.append(series(name + "_count", labels, count))
+                lines.append(series(name + "_seconds_total", labels, total))
+                lines.append(series(name + "_seconds_max", labels, longest))
+        return "\n".join(lines) + "\n"
+
+
+# This function escapes the characters that can't be written as they are inside a prometheus label
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+
+
+# This function serves the metrics on http://host:port/metrics from a background thread so that prometheus can collect them
+def serve_metrics(port, host="127.0.0.1", source=metrics):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = source.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,40 @@
+from bs4 import BeautifulSoup as bs, SoupStrainer
+
+# The fast parsers are optional, the program falls back to the pure python parser that comes with python when they aren't installed
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+
+# BeautifulSoup can use lxml, which is written in C, instead of the html.parser module
+SOUP_FEATURES = "html.parser" if lxml is None else "lxml"
+
+# These are the backends that can be used for the article pages, the fastest one that is installed is used by default
+BACKENDS = [backend for backend, module in (("selectolax", HTMLParser), ("lxml", lxml), ("html.parser", True)) if module is not None]
+PARSER_BACKEND = BACKENDS[0]
+
+# Only the paragraphs of an article page are needed, so BeautifulSoup doesn't have to build the rest of the page
+PARAGRAPHS = SoupStrainer("p")
+
+
+# This function makes a BeautifulSoup of a page, parse_only can be a SoupStrainer so that only the parts of the page that are read get built
+def make_soup(html, parse_only=None):
+    return bs(html, SOUP_FEATURES, parse_only=parse_only)
+
+
+# This function returns the text of every paragraph of an article page
+def article_paragraphs(html, backend=None):
+    backend = backend or PARSER_BACKEND
+    if backend == "selectolax":
+        return [node.text() for node in HTMLParser(html).css("p")]
+    soup = bs(html, backend, parse_only=PARAGRAPHS)
+    return [par.text for par in soup.find_all("p")]
@@ -0,0 +1,79 @@
+import os
+import re
+
+import numpy as np
+
+# matplotlib takes a long time to import, so it is only imported by the functions that draw a graph and the commands that don't draw anything never pay for it
+# Every graph gets its own Figure on the Agg canvas instead of going through pyplot, so nothing is shared between graphs and no window is opened
+
+PLOT_DIRECTORY = "plots"
+PLOT_FORMATS = ("png", "svg")
+
+# A series with more points than this is shrunk before it is drawn, the screen can't show more points than it has pixels anyway
+MAX_POINTS = 2000
+
+FIGURE_SIZE = (10, 5)
+DPI = 100
+
+
+def new_figure():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+
+# This function shrinks a long series by keeping the lowest and the highest value of every bucket of days, so the peaks are still drawn
+def downsample(days, values, max_points=MAX_POINTS):
+    if len(days) <= max_points:
+        return days, values
+    bucket = -(-len(days) // (max_points // 2))
+    buckets = -(-len(days) // bucket)
+    padded = np.full(buckets * bucket, np.nan)
+    padded[:len(values)] = values
+    padded = padded.reshape(buckets, bucket)
+    # The two points of every bucket are drawn at its first day and halfway through it
+    starts = days[::bucket]
+    middles = starts + np.minimum(bucket // 2, len(days) - 1 - np.arange(0, len(days), bucket))
+    return (np.column_stack([starts, middles]).ravel(),
+            np.column_stack([np.nanmin(padded, axis=1), np.nanmax(padded, axis=1)]).ravel())
+
+
+# This function turns the title of a graph into a file name, the format is png or svg
+def plot_path(title, directory=PLOT_DIRECTORY, plot_format="png"):
+    os.makedirs(directory, exist_ok=True)
+    name = re.sub(r"[^a-z0-9]+", "-", title.lower()).strip("-") or "plot"
+    return os.path.join(directory, f"{name}.{plot_format}")
+
+
+# This function draws every series of the trends over real dates and saves the graph to the path
+def render_trends(trends, title, path, ylabel="Occurrence"):
+    import matplotlib.dates as mdates
+
+    figure, axes = new_figure()
+    for label, values in zip(trends.labels, trends.values):
+        days, values = downsample(trends.days, values)
+        axes.plot(days, values, label=label.title())
+    locator = mdates.AutoDateLocator()
+    axes.xaxis.set_major_locator(locator)
+    axes.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    axes.set_title(title)
+    axes.set_xlabel("Date")
+    axes.set_ylabel(ylabel)
+    if trends.labels:
+        axes.legend(loc="best")
+    figure.savefig(path)
+    return path
+
+
+# This function draws a bar for every key of the counts and saves the graph to the path
+def render_bars(counts, title, path, xlabel="Category", ylabel="Occurrence"):
+    figure, axes = new_figure()
+    axes.bar([str(key) for key in counts], list(counts.values()))
+    axes.set_title(title)
+    axes.set_xlabel(xlabel)
+    axes.set_ylabel(ylabel)
+    figure.savefig(path)
+    return path
@@ -0,0 +1,101 @@
+from urllib.parse import urlsplit, urlunsplit, urljoin
+
+from bs4 import SoupStrainer
+
+from parsing import make_soup
+
+
+# This function turns the different ways of writing the same article url into one, so that the same article isn't saved twice
+def normalize_url(url):
+    scheme, host, path, query, fragment = urlsplit(url.strip())
+    scheme = scheme.lower()
+    host = host.lower()
+    # The default ports mean the same thing as no port at all
+    if (scheme == "https" and host.endswith(":443")) or (scheme == "http" and host.endswith(":80")):
+        host = host.rsplit(":", 1)[0]
+    # The query strings and fragments on news sites only track where the reader came from, they don't change the article
+    path = path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, "", ""))
+
+
+# This function returns the host of a url without www. so that www.reuters.com and reuters.com are treated as the same site
+def site_of(url):
+    host = urlsplit(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+# A scraper definition describes where the article links are on the front page of a news site and how many requests can be sent to it at the same time
+# The links are a list of (item selector, link selector) pairs of css selectors, the link selector is looked up inside every item and can be None if the item is the link itself
+# When max_requests is None the fetcher's own limit per domain is used
+class ScraperDefinition:
+
+    def __init__(self, links, parse_only=None, normalize=normalize_url, max_requests=None):
+        self.links = links
+        self.parse_only = parse_only
+        self.normalize = normalize
+        self.max_requests = max_requests
+
+    # This function returns the normalized urls of the articles on a front page
+    def find_urls(self, domain_url, content):
+        soup = make_soup(content, self.parse_only)
+        article_urls = set()
+        for item_selector, link_selector in self.links:
+            for item in soup.select(item_selector):
+                link = item if link_selector is None else item.select_one(link_selector)
+                if link is None or not link.get("href"):
+                    continue
+                # urljoin keeps the links that already have the domain in them and adds the domain to the rest
+                article_urls.add(self.normalize(urljoin(domain_url, link["href"])))
+        return article_urls
+
+
+# The generic scraper is used for domains that don't have their own definition, it takes every link to the same site whose last part looks like an article title
+class GenericScraperDefinition(ScraperDefinition):
+
+    def __init__(self):
+        super().__init__([("a[href]", None)])
+
+    def find_urls(self, domain_url, content):
+        site = site_of(domain_url)
+        article_urls = set()
+        for url in super().find_urls(domain_url, content):
+            slug = urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+            if site_of(url) == site and slug.count("-") >= 3:
+                article_urls.add(url)
+        return article_urls
+
+
+# This function tells the parser which parts of the apnews front page to build
+# Newer versions of BeautifulSoup only give the tag name to this function, then every tag is kept and the page is parsed in full
+def is_ap_section(name, attrs=None):
+    if attrs is None:
+        return True
+    return name == "div" and (attrs.get("data-tb-region") == "Top Stories" or attrs.get("data-key") == "feed-card-hub-peak")
+
+
+# The scrapers are registered under the domain as it is written in the domains table
+SCRAPERS = {}
+
+
+def register_scraper(domain_url, definition):
+    SCRAPERS[domain_url] = definition
+
+
+# This function returns the scraper for a domain, or the generic one if it doesn't have its own
+def scraper_for(domain_url):
+    return SCRAPERS.get(domain_url) or GenericScraperDefinition()
+
+
+# Only the story cards are built, the rest of the front page is skipped while parsing
+register_scraper("https://reuters.com", ScraperDefinition(
+    links=[('div[data-testid="MediaStoryCard"]', 'a[data-testid="Heading"]'),
+           ('div[data-testid="TextStoryCard"]', 'a[data-testid="Heading"]')],
+    parse_only=SoupStrainer("div", attrs={"data-testid": ["MediaStoryCard", "TextStoryCard"]}),
+))
+
+# Only the top stories and the feed are built, the rest of the front page is skipped while parsing
+register_scraper("https://apnews.com", ScraperDefinition(
+    links=[('div[data-tb-region="Top Stories"] a[data-key="card-headline"]', None),
+           ('div[data-key="feed-card-hub-peak"] li', "a")],
+    parse_only=SoupStrainer(is_ap_section),
+))
@@ -0,0 +1,191 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import main
+from database import database
+
+
+PAGE = b"<html><body><p>The missile was fired.</p><p>It hit nothing.</p></body></html>"
+
+
+# This server answers /page with an article, /slow after a fifth of a second and /error with a 500
+# It remembers the client port of every request and how many requests it was handling at the same time
+class NewsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), NewsHandler)
+        self.lock = threading.Lock()
+        self.client_ports = []
+        self.starts = []
+        self.active = 0
+        self.max_active = 0
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class NewsHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open, so the requests of one session come from the same client port
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.client_ports.append(self.client_address[1])
+            self.server.starts.append(time.monotonic())
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.2)
+            status = 500 if self.path.startswith("/error") else 200
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servers():
+    servers = [NewsServer(), NewsServer()]
+    threads = [threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = main.Fetcher(workers=8, per_domain=2, timeout=5, cache=None)
+    yield fetcher
+    fetcher.close()
+
+
+def test_every_host_gets_one_session_that_is_reused(servers, fetcher):
+    for _ in range(3):
+        for server in servers:
+            assert fetcher.fetch(server.url("/page")) == PAGE
+    assert sorted(fetcher.sessions) == sorted(main.site_of(server.url("/")) for server in servers)
+    # The three requests to a host went over one kept alive connection
+    for server in servers:
+        assert len(set(server.client_ports)) == 1
+
+
+def test_no_more_requests_than_the_limit_go_to_one_host(servers, fetcher):
+    articles = [main.Article(servers[0].url(f"/slow/{index}"), 1) for index in range(6)]
+    results = list(fetcher.fetch_all(articles))
+    assert sorted(article.url for article, content, error in results) == sorted(article.url for article in articles)
+    assert all(error is None for article, content, error in results)
+    assert servers[0].max_active == 2
+
+
+# The articles come grouped by site the way the front pages add them, every site still gets its downloads started right away
+# There are only as many workers as both sites can take, so a worker that waits on a busy site would slow the other site down
+def test_grouped_sites_are_downloaded_at_the_same_time(servers):
+    fetcher = main.Fetcher(workers=4, per_domain=2, timeout=5, cache=None)
+    articles = [main.Article(server.url(f"/slow/{index}"), 1) for server in servers for index in range(6)]
+    start = time.monotonic()
+    try:
+        results = list(fetcher.fetch_all(articles))
+    finally:
+        fetcher.close()
+    assert len(results) == len(articles) and all(error is None for article, content, error in results)
+    for server in servers:
+        assert server.max_active == 2
+        assert min(server.starts) - start < 0.1
+    # Six pages with two at a time take three turns of a fifth of a second, the sites in turn would take twice as long
+    assert time.monotonic() - start < 1
+
+
+def test_a_slow_page_times_out_without_stopping_the_others(servers):
+    fetcher = main.Fetcher(workers=4, per_domain=4, timeout=0.05, cache=None)
+    try:
+        results = {article.url: (content, error) for article, content, error in
+                   fetcher.fetch_all([main.Article(servers[0].url("/slow"), 1), main.Article(servers[1].url("/page"), 1)])}
+    finally:
+        fetcher.close()
+    content, error = results[servers[0].url("/slow")]
+    assert content is None and isinstance(error, requests.Timeout)
+    assert results[servers[1].url("/page")] == (PAGE, None)
+
+
+def test_a_server_error_is_returned_with_the_article(servers, fetcher):
+    [(article, content, error)] = list(fetcher.fetch_all([main.Article(servers[0].url("/error"), 1)]))
+    assert content is None and isinstance(error, requests.HTTPError)
+
+
+@pytest.fixture
+def news_database(tmp_path):
+    database.open(str(tmp_path / "news.db"))
+    main.setup_database()
+    yield
+    database.close()
+
+
+# A failed article stays in unscraped_articles and is tried again once its backoff has passed, until it has failed too many times
+def test_failed_articles_are_retried_after_their_backoff(servers, fetcher, news_database):
+    url = servers[0].url("/error")
+    with database.unit_of_work() as cursor:
+        cursor.execute("insert into domains (domain) values (?)", (servers[0].url(""),))
+        cursor.execute("insert into unscraped_articles (domain_id, url) values (1, ?)", (url,))
+    for attempt in range(1, main.MAX_FETCH_ATTEMPTS + 1):
+        assert [article.url for article in main.load_unscraped_articles()] == [url]
+        assert main.scrape_articles(fetcher, workers=0)["failed"] == 1
+        assert main.load_unscraped_articles() == []
+        with database.unit_of_work() as cursor:
+            assert cursor.execute("select attempts from fetch_failures where url = ?", (url,)).fetchone()[0] == attempt
+            cursor.execute("update fetch_failures set retry_after = 0")
+    assert main.load_unscraped_articles() == []
+
+
+def test_an_article_that_works_on_a_retry_is_stored(servers, fetcher, news_database):
+    url = servers[0].url("/page")
+    with database.unit_of_work() as cursor:
+        cursor.execute("insert into domains (domain) values (?)", (servers[0].url(""),))
+        cursor.execute("insert into unscraped_articles (domain_id, url) values (1, ?)", (url,))
+        cursor.execute("insert into fetch_failures (url, attempts, last_error, retry_after) values (?, 1, 'timed out', 0)", (url,))
+    assert main.scrape_articles(fetcher, workers=0)["scraped"] == 1
+    with database.unit_of_work() as cursor:
+        assert cursor.execute("select count(*) from fetch_failures").fetchone()[0] == 0
+        assert cursor.execute("select url from scraped_articles").fetchall() == [(url,)]
+
+
+# The front pages add their urls one site at a time, the articles of every site are still downloaded in the same pass at the same time
+def test_one_pass_downloads_the_sites_of_a_round_together(servers, news_database):
+    with database.unit_of_work() as cursor:
+        for domain_id, server in enumerate(servers, 1):
+            cursor.execute("insert into domains (domain) values (?)", (server.url(""),))
+            cursor.executemany("insert into unscraped_articles (domain_id, url) values (?, ?)",
+                               [(domain_id, server.url(f"/slow/{index}")) for index in range(6)])
+    fetcher = main.Fetcher(workers=4, per_domain=2, timeout=5, cache=None)
+    start = time.monotonic()
+    try:
+        assert main.scrape_articles(fetcher, workers=0)["scraped"] == 12
+    finally:
+        fetcher.close()
+    for server in servers:
+        assert min(server.starts) - start < 0.1
+
+
+# The scrape command prints its summary as json, so a front page that fails is logged and returned instead of printed
+def test_a_failed_front_page_is_returned_and_not_printed(servers, fetcher, news_database, capsys):
+    servers[0].server_close()
+    with database.unit_of_work() as cursor:
+        cursor.execute("insert into domains (domain) values (?)", (servers[0].url(""),))
+    failures = main.scrape_front_pages(fetcher)
+    assert list(failures) == [servers[0].url("")]
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import main
+from metrics import metrics
+
+
+def test_a_held_lock_raises_scrape_locked_error(tmp_path):
+    path = str(tmp_path / "scrape.lock")
+    with main.scrape_lock(path):
+        with pytest.raises(main.ScrapeLockedError):
+            with main.scrape_lock(path):
+                pass
+    assert not os.path.exists(path)
+
+
+def test_a_lock_without_a_pid_is_taken_over(tmp_path):
+    path = str(tmp_path / "scrape.lock")
+    open(path, "w").close()
+    os.utime(path, (0, 0))
+    with main.scrape_lock(path):
+        with open(path) as file:
+            assert file.read() == str(os.getpid())
+
+
+# Only a held lock skips a round, any other error of a round is counted as a failed round
+@pytest.mark.parametrize("error, round_errors", [(main.ScrapeLockedError("locked"), 0), (RuntimeError("broken"), 1)])
+def test_the_scheduler_only_skips_rounds_for_a_held_lock(monkeypatch, error, round_errors):
+    def failing_round(workers):
+        raise error
+
+    monkeypatch.setattr(main, "timed_scrape_round", failing_round)
+    metrics.reset()
+    main.run_scheduler(0, rounds=1)
+    counters = {counter["name"]: counter["value"] for counter in metrics.snapshot()["counters"]}
+    assert counters.get("round_errors", 0) == round_errors
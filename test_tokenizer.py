@@ -0,0 +1,46 @@
+import pytest
+
+from benchmark import legacy_separate_words
+from tokenizer import separate_words, iter_bigrams, iter_words
+
+
+CORPUS = [
+    "",
+    "   ",
+    "Missile",
+    "The army, the navy. And the air-force: all of them!",
+    "It's the government's plan, they'd said “no” and ‘maybe’ to the “armed forces”.",
+    "Prices rose 3.5% in 2022/2023 - the highest since 1981",
+    "Ünïcödé wörds, Ελληνικά and 日本語 text, İstanbul and ß",
+    "Tabs\tand\nnew lines\r\nare   spaces too",
+    "trailing punctuation...",
+    '"Quoted" words, \'single quoted\' ones',
+]
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_separate_words_matches_the_old_split(text):
+    assert separate_words(text) == legacy_separate_words(text)
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_iter_words_matches_the_old_split(text):
+    assert list(iter_words(text)) == legacy_separate_words(text)
+
+
+# A small chunk size makes iter_words cut the text in many places, no word may be split at a cut
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 16])
+def test_iter_words_matches_the_old_split_in_small_chunks(chunk_size):
+    text = " ".join(CORPUS)
+    assert list(iter_words(text, chunk_size)) == legacy_separate_words(text)
+
+
+def test_iter_words_on_a_text_without_spaces():
+    text = "a-very-long-hyphenated-word" * 10
+    assert list(iter_words(text, 8)) == legacy_separate_words(text)
+
+
+def test_iter_bigrams_pairs_every_word_with_the_one_before_it():
+    words = legacy_separate_words(CORPUS[4])
+    assert list(iter_bigrams(CORPUS[4])) == list(zip(words, [None] + [f"{before} {word}" for before, word in zip(words, words[1:])]))
+    assert list(iter_bigrams("")) == []
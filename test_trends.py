@@ -0,0 +1,50 @@
+import pytest
+
+import main
+from database import database
+from textstore import compress_text
+
+
+# The days around new year 2023 are in one week that starts on monday 2022-12-26, and the next week starts on monday 2023-01-02
+DAYS = ["2022-12-31", "2023-01-01", "2023-01-02"]
+
+
+@pytest.fixture
+def news_database(tmp_path):
+    database.open(str(tmp_path / "news.db"))
+    with database.unit_of_work() as cursor:
+        cursor.execute("create table categories (id integer primary key, category text)")
+        cursor.execute("create table search_terms (id integer primary key, category_id integer references categories(id), term text)")
+        cursor.execute("insert into categories (category) values ('war')")
+        cursor.execute("insert into search_terms (category_id, term) values (1, 'missile')")
+    main.setup_database()
+    with database.unit_of_work() as cursor:
+        for day in DAYS:
+            cursor.execute("insert into scraped_articles (url, category_id, date) values (?, 1, ?)", (f"https://example.com/{day}", day))
+            cursor.execute("insert into article_texts (article_id, text) values (?, ?)", (cursor.lastrowid, compress_text("a missile and a rocket were fired")))
+    main.update_term_index()
+    yield
+    database.close()
+
+
+def test_weeks_are_keyed_by_their_monday():
+    assert [main.period_key(day, "week") for day in DAYS] == ["2022-12-26", "2022-12-26", "2023-01-02"]
+
+
+@pytest.mark.parametrize("period", ["day", "week", "month", "year"])
+def test_counts_and_trends_use_the_same_periods(news_database, period):
+    trends = main.load_term_trends(["missile"]).resample(period).to_dict(main.PERIOD_FORMATS[period])["missile"]
+    # missile is counted from the term index and rocket from the article texts
+    assert main.count_word_occurrence("missile", period) == trends
+    assert main.count_word_occurrence("rocket", period) == trends
+    assert main.count_category_occurrence(1, period) == trends
+
+
+def test_week_counts_around_new_year(news_database):
+    assert main.count_word_occurrence("missile", "week") == {"2022-12-26": 2, "2023-01-02": 1}
+
+
+def test_terms_that_are_asked_for_twice_get_one_series(news_database):
+    trends = main.load_term_trends(["missile", "missile"])
+    assert trends.labels == ["missile"]
+    assert trends.series("missile").tolist() == [1, 1, 1]
@@ -0,0 +1,52 @@
+import zlib
+
+# zstandard compresses and decompresses faster than zlib, it is optional and zlib from the standard library is used when it isn't installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# The first byte of every stored text says how the rest was compressed, so a database can hold texts that were written with either codec
+ZLIB = b"z"
+ZSTD = b"s"
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# The texts are read from the database this many rows at a time, so only a small part of the archive is ever in memory
+FETCH_SIZE = 500
+
+CODEC = ZLIB if zstandard is None else ZSTD
+
+
+# This function compresses the text of an article into the bytes that are stored in the database
+# zstandard's compressors can't be shared by threads, so a new one is made for every text, which is cheap at this level
+def compress_text(text, codec=CODEC):
+    data = text.encode("utf-8")
+    if codec == ZSTD:
+        return ZSTD + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return ZLIB + zlib.compress(data, ZLIB_LEVEL)
+
+
+# This function turns the stored bytes back into the text of the article, None stays None
+def decompress_text(blob):
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    codec, data = blob[:1], blob[1:]
+    if codec == ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("This article text was compressed with zstandard, install it with pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown text compression {codec!r}")
+
+
+# This generator yields the rows of a query that was already executed on the cursor a few at a time, instead of fetching all of them at once
+def iter_rows(cursor, size=FETCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
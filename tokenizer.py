@@ -0,0 +1,37 @@
+# These are the punctuation marks that separate_words takes out of the text, the ones that are replaced with a space split the words around them
+# str.replace only copies the text when the character is actually in it, which makes this faster than str.translate or a regex for mostly plain text
+REPLACEMENTS = ((",", ""), (".", ""), ("“", ""), ("’", " "), ("‘", ""), ("-", " "), ("”", ""), ('"', ""), ("'", " "), (":", ""), ("/", " "))
+
+# This is how much text iter_words tokenizes at a time
+CHUNK_SIZE = 64 * 1024
+
+
+# This function removes punctuation and splits text in to a list of words so that I can search the list for search terms
+def separate_words(words):
+    for old, new in REPLACEMENTS:
+        words = words.replace(old, new)
+    return words.lower().split()
+
+
+# This function gives the same words as separate_words one at a time, only a small piece of a long text is copied and split at once
+def iter_words(text, chunk_size=CHUNK_SIZE):
+    start = 0
+    length = len(text)
+    while start < length:
+        end = start + chunk_size
+        if end < length:
+            # The pieces are cut at a space so that no word is split in two
+            cut = text.rfind(" ", start, end)
+            if cut <= start:
+                cut = text.find(" ", end)
+            end = length if cut == -1 else cut
+        yield from separate_words(text[start:end])
+        start = end
+
+
+# This function gives every word together with the two word phrase that ends with it, the phrase is None for the first word
+def iter_bigrams(text):
+    previous_word = None
+    for word in iter_words(text):
+        yield word, None if previous_word is None else previous_word + " " + word
+        previous_word = word
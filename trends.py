@@ -0,0 +1,95 @@
+import numpy as np
+
+
+# The trends keep the counts of many search terms or categories on a date axis without gaps, one row per series and one column per period
+# The volume is the amount of articles in every period, so the counts can be turned into a share of the articles
+class Trends:
+
+    def __init__(self, days, values, labels, volume, period="day"):
+        self.days = days
+        self.values = values
+        self.labels = labels
+        self.volume = volume
+        self.period = period
+
+    # This function makes the trends from (series index, day, count) rows, the days between start and end that aren't in the rows get a count of 0
+    @classmethod
+    def from_rows(cls, labels, rows, volume_rows, start, end):
+        days = day_axis(start, end)
+        values = np.zeros((len(labels), len(days)))
+        volume = np.zeros(len(days))
+        if len(days):
+            series, day_strings, counts = unzip(rows, 3)
+            np.add.at(values, (np.array(series, dtype=np.intp), day_index(day_strings, days[0])), counts)
+            day_strings, counts = unzip(volume_rows, 2)
+            np.add.at(volume, day_index(day_strings, days[0]), counts)
+        return cls(days, values, list(labels), volume)
+
+    def series(self, label):
+        return self.values[self.labels.index(label)]
+
+    # This function returns the trends with only the series that have these labels
+    def subset(self, labels):
+        rows = [self.labels.index(label) for label in labels]
+        return Trends(self.days, self.values[rows], list(labels), self.volume, self.period)
+
+    # This function puts the series of two trends over the same days together
+    def combine(self, other):
+        return Trends(self.days, np.vstack([self.values, other.values]), self.labels + other.labels, self.volume, self.period)
+
+    # This function adds the days up into weeks starting on monday, months or years, the new dates are the first day of every period
+    def resample(self, period):
+        if period == "day" or not len(self.days):
+            return Trends(self.days, self.values, self.labels, self.volume, period)
+        if period == "week":
+            # numpy counts days from a thursday, 1970-01-01, so three days are added to get the days since a monday
+            starts = self.days - (self.days.astype(np.int64) + 3) % 7
+        elif period == "month":
+            starts = self.days.astype("datetime64[M]").astype("datetime64[D]")
+        elif period == "year":
+            starts = self.days.astype("datetime64[Y]").astype("datetime64[D]")
+        else:
+            raise ValueError(f"Unknown period {period}")
+        # The days are in order, so every period is one run of days and reduceat adds up every run at once
+        firsts = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        return Trends(starts[firsts], np.add.reduceat(self.values, firsts, axis=1), self.labels,
+                      np.add.reduceat(self.volume, firsts), period)
+
+    # This function divides the counts by the amount of articles in the same period, the periods without articles stay 0
+    def normalized(self):
+        values = np.divide(self.values, self.volume, out=np.zeros_like(self.values), where=self.volume > 0)
+        return Trends(self.days, values, self.labels, self.volume, self.period)
+
+    # This function replaces every value with the average of it and the window - 1 values before it, the first values are averaged over the values that exist
+    def rolling(self, window):
+        if window <= 1 or not len(self.days):
+            return self
+        sums = np.cumsum(np.pad(self.values, ((0, 0), (1, 0))), axis=1)
+        ends = np.arange(1, len(self.days) + 1)
+        starts = np.maximum(ends - window, 0)
+        values = (sums[:, ends] - sums[:, starts]) / (ends - starts)
+        return Trends(self.days, values, self.labels, self.volume, self.period)
+
+    # This function returns every series as a dictionary with the periods written in the date format as keys
+    def to_dict(self, date_format):
+        keys = [day.strftime(date_format) for day in self.days.astype(object)]
+        return {label: dict(zip(keys, row.tolist())) for label, row in zip(self.labels, self.values)}
+
+
+# This function returns every day from start to end, both are yyyy-mm-dd and the axis is empty if either of them is None
+def day_axis(start, end):
+    if start is None or end is None:
+        return np.array([], dtype="datetime64[D]")
+    return np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+
+
+def day_index(day_strings, first_day):
+    return (np.array(day_strings, dtype="datetime64[D]") - first_day).astype(np.intp)
+
+
+# This function turns a list of rows into one list per column, an empty list of rows gives empty columns
+def unzip(rows, columns):
+    rows = list(rows)
+    if not rows:
+        return [[] for _ in range(columns)]
+    return [list(column) for column in zip(*rows)]